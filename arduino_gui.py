@@ -6,9 +6,11 @@ import pdb
 
 def start_sampler():
     sampler.initialize()
+    sampler.start()
 
 
 def get_data():
+    # reads the sampler's latest snapshot, never waits for sampling
     data = sampler.get_data()
     if data is not None:
         update_controls(data)
@@ -41,3 +43,4 @@ while True:
     if event in (sg.WIN_CLOSED, 'Exit'):
         break
     get_data()
+sampler.stop()
@@ -0,0 +1,110 @@
+# file: async_signal_processor.py
+
+import asyncio
+import itertools
+import httpx
+from signal_processor import ArduinoSignalProcessor
+
+
+class AsyncArduinoSignalProcessor(ArduinoSignalProcessor):
+    """
+    asyncio variant of ArduinoSignalProcessor. The window logic is shared
+    (begin_window, sample_tick, end_window); only the waiting differs:
+    ticks are awaited with asyncio.sleep and posts go through an
+    httpx.AsyncClient, so sampling, change detection and uploads can
+    overlap in one event loop. initialize() stays synchronous.
+    """
+
+    def initialize(self, config, Arduino, util, timestamp):
+        super().initialize(config, Arduino, util, timestamp)
+        self.client = httpx.AsyncClient()
+        self.uploads = set()   # in-flight post tasks
+
+    async def ticks_async(self, num=None):
+        """
+        Async generator twin of ticks(): same monotonic deadlines, but the
+        wait yields to the event loop instead of blocking it.
+        """
+        interval = self.sample_interval
+        start = self.clock.monotonic()
+        for i in itertools.count() if num is None else range(num):
+            delay = start + i * interval - self.clock.monotonic()
+            if delay > 0:
+                await self.clock.sleep_async(delay)
+            yield i
+
+    async def collect_inputs(self):
+        """
+        RETURNS: Nothing
+        SIDE_EFFECT: current_state dict is updated with smoothed values.
+        Same window as ArduinoSignalProcessor.collect_inputs. With
+        sampling_mode 'events', collect_reports() waits on the report
+        queue in a worker thread, so the event loop keeps running.
+        """
+        if self.reports is not None:
+            return await asyncio.to_thread(self.collect_reports)
+        window = self.begin_window()
+        async for i in self.ticks_async(window['ticks']):
+            if not self.sample_tick(window, i):
+                break
+        self.end_window(window)
+
+    async def changed(self, ts):
+        """
+        Same rules as ArduinoSignalProcessor.changed. Pure computation, so
+        it never waits; it is async so callers can await every stage alike.
+        """
+        return super().changed(ts)
+
+    def encode_record(self, datetimestamp, state=None):
+        """
+        RETURNS: (body, headers) of the record, as encode() gives them.
+        SIDE_EFFECT: db_saved is set to the record's time, so changed()
+        measures from this record even while its post is in flight.
+        """
+        body, headers = self.encode(datetimestamp, state)
+        print()
+        print(f'sending to db: {body}')
+        self.db_saved = datetimestamp.timestamp()
+        return body, headers
+
+    async def post(self, body, headers):
+        return await self.client.post(self.db_url, content=body,
+                                      headers=headers)
+
+    async def update_db(self, datetimestamp, state=None):
+        body, headers = self.encode_record(datetimestamp, state)
+        if body is None:   # narrow: no pin changed, nothing to store
+            return None
+        return await self.post(body, headers)
+
+    async def run(self, now, on_data=None, count=None):
+        """
+        Sampling loop. now() returns a datetime for the record timestamp.
+        Each changed record is encoded when its window ends and posted by a
+        background task, so a slow database POST never delays the next
+        sampling window. A failed post is printed, not raised.
+        on_data(record) is called after every window. count=None runs
+        forever. Waits for pending posts before returning.
+        """
+        for _ in itertools.count() if count is None else range(count):
+            await self.collect_inputs()
+            dts = now()
+            if await self.changed(dts.timestamp()):
+                body, headers = self.encode_record(
+                    dts, dict(self.current_state))
+                if body is not None:
+                    task = asyncio.create_task(self.post(body, headers))
+                    self.uploads.add(task)
+                    task.add_done_callback(self.upload_done)
+            if on_data is not None:
+                on_data({**self.current_state, "ts": str(dts)})
+        await asyncio.gather(*self.uploads, return_exceptions=True)
+
+    def upload_done(self, task):
+        self.uploads.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            print(f'upload failed: {task.exception()!r}')
+
+    async def aclose(self):
+        await self.client.aclose()
@@ -0,0 +1,197 @@
+# file: bench.py
+
+import io
+import sys
+import json
+import time
+import random
+import itertools
+import timeit
+import platform
+import argparse
+import datetime
+import contextlib
+import config
+import sim
+import signal_processor
+from supervisor import board_config
+
+WINDOW_SIZES = [10, 100, 1000, 10000, 100000]           # reads per window
+POINT_SIZES = [10 ** e for e in range(1, 8)]            # 10 .. 10M points
+ANALOGS = [f'A{i}' for i in range(6)]
+DIGITALS = [f'D{i}' for i in range(2, 14)]
+PINS = {3: ['A1', 'D2', 'D3'], 18: ANALOGS + DIGITALS}  # pins sampled
+
+
+def sim_proc(input_names, analog_num=10):
+    """
+    RETURNS: an ArduinoSignalProcessor sampling a sim.Simulator on a
+    virtual clock: noisy analogs, digitals that settle at once except
+    D3, which alternates on every read and so never settles.
+    """
+    waves = {a: sim.with_noise(sim.constant(300), 2, seed=i)
+             for i, a in enumerate(ANALOGS)}
+    waves.update({d: sim.constant(1) for d in DIGITALS})
+    bits = itertools.cycle([1, 0])
+    waves['D3'] = lambda t: next(bits)
+    s = sim.Simulator(waves)
+    proc = signal_processor.ArduinoSignalProcessor()
+    proc.clock = s.clock
+    with contextlib.redirect_stdout(io.StringIO()):
+        proc.initialize(board_config(config, {
+            'input_names': input_names, 'src': 'bench', 'capture_path': None,
+            'compression': None, 'initial_analog_num': analog_num}),
+            s.Arduino, s.util, s.clock.time())
+    proc.analog_num_lookup = {2048: analog_num}   # windows keep their size
+    return proc
+
+
+def bench_collect_inputs(size):
+    proc = sim_proc(['A0', 'A1', 'D2'], size)
+    return proc.collect_inputs
+
+
+def bench_smooth_analog(size):
+    proc = sim_proc(['A1'], size)
+    return lambda: proc.smooth_analog(1)
+
+
+def bench_smooth_digital(size):
+    """ the pin never settles, so every call takes size reads """
+    proc = sim_proc(['D3'])
+    proc.digital_read_budget = size
+    proc.digital_time_budget = float('inf')
+    return lambda: proc.smooth_digital(3)
+
+
+def bench_changed(size):
+    proc = sim_proc(PINS[size])
+    proc.db_interval = 0
+    proc.collect_inputs()
+    ts = proc.clock.time()
+    return lambda: proc.changed(ts)
+
+
+def bench_json_encode(size):
+    proc = sim_proc(PINS[size])
+    proc.collect_inputs()
+    ts = str(proc.clock.now())
+    return lambda: proc.json_encode(ts)
+
+
+def bench_avg_by(size):
+    import plot_gui
+    lst = [random.randrange(1024) for _ in range(size)]
+    return lambda: plot_gui.avg_by(lst, 10)
+
+
+def bench_every_nth(size):
+    import plot_gui
+    lst = [random.randrange(1024) for _ in range(size)]
+    return lambda: plot_gui.every_nth(lst, 10)
+
+
+# name: (setup(size) returning the function to time, sizes)
+BENCHMARKS = {
+    'collect_inputs': (bench_collect_inputs, WINDOW_SIZES),
+    'smooth_analog': (bench_smooth_analog, WINDOW_SIZES),
+    'smooth_digital': (bench_smooth_digital, WINDOW_SIZES),
+    'changed': (bench_changed, list(PINS)),
+    'json_encode': (bench_json_encode, list(PINS)),
+    'avg_by': (bench_avg_by, POINT_SIZES),
+    'every_nth': (bench_every_nth, POINT_SIZES),
+}
+
+
+def measure(fn, repeat=5):
+    """
+    times fn with timeit: the call count is grown until a run lasts 0.2
+    secs, then repeat runs are timed.
+    RETURNS: dict of the best and median secs per call and the calls per run.
+    """
+    timer = timeit.Timer(fn)
+    number, secs = timer.autorange()
+    if secs > 2:   # slow: fewer runs
+        repeat = 1
+    runs = sorted(t / number for t in timer.repeat(repeat, number))
+    return {'best': runs[0], 'median': runs[len(runs) // 2],
+            'number': number}
+
+
+def run(names=None, max_size=None, repeat=5):
+    """
+    RETURNS: dict of results, keyed like 'avg_by[1000]', and run metadata,
+    ready to be saved as a baseline.
+    """
+    results = {}
+    for name, (setup, sizes) in BENCHMARKS.items():
+        if names and name not in names:
+            continue
+        for size in sizes:
+            if max_size and size > max_size:
+                continue
+            key = f'{name}[{size}]'
+            result = measure(setup(size), repeat)
+            results[key] = result
+            print(f'{key:24} {result["best"] * 1e6:14.2f} usec/call')
+    return {'meta': {'date': str(datetime.datetime.now()),
+                     'python': platform.python_version(),
+                     'machine': platform.machine(),
+                     'node': platform.node()},
+            'results': results}
+
+
+def compare(baseline, current, threshold=1.25):
+    """
+    RETURNS: list of (key, baseline secs, current secs) of the benchmarks
+    whose best time grew by more than threshold times since baseline.
+    """
+    regressions = []
+    for key, result in current['results'].items():
+        old = baseline['results'].get(key)
+        if old is not None and result['best'] > old['best'] * threshold:
+            regressions.append((key, old['best'], result['best']))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Benchmarks the sampling and plotting hot paths on a '
+                    'simulated board.')
+    parser.add_argument('names', nargs='*',
+                        help='benchmarks to run, default all: '
+                             f'{list(BENCHMARKS)}')
+    parser.add_argument('--max-size', type=int,
+                        help='skip sizes above this')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--save', metavar='PATH',
+                        help='write the results as a json baseline')
+    parser.add_argument('--compare', metavar='PATH',
+                        help='flag regressions against this baseline')
+    parser.add_argument('--threshold', type=float, default=1.25,
+                        help='slowdown that counts as a regression')
+    args = parser.parse_args(argv)
+    unknown = set(args.names) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f'unknown benchmarks: {sorted(unknown)}')
+
+    t0 = time.perf_counter()
+    current = run(args.names, args.max_size, args.repeat)
+    print(f'{len(current["results"])} benchmarks in '
+          f'{time.perf_counter() - t0:.0f} secs')
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(current, f, indent=1)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, current, args.threshold)
+        for key, old, new in regressions:
+            print(f'REGRESSION {key}: {old * 1e6:.2f} -> {new * 1e6:.2f} '
+                  f'usec/call ({new / old:.2f}x)')
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,99 @@
+# file: capture.py
+
+import os
+import mmap
+import time
+import struct
+import numpy as np
+
+# file: HEADER, then capacity fixed size RECORDs used as a ring.
+# header: magic, capacity (records), count (records ever written)
+HEADER = struct.Struct('<8sQQ')
+MAGIC = b'ARDCAP01'
+# record: monotonic ns i64, kind u8, pin u8, 2 pad bytes, raw read f32
+RECORD = struct.Struct('<qBBxxf')
+DTYPE = np.dtype([('ns', '<i8'), ('kind', 'u1'), ('pin', 'u1'),
+                  ('pad', 'V2'), ('value', '<f4')])
+ANALOG, DIGITAL = 0, 1
+assert DTYPE.itemsize == RECORD.size
+
+
+class RawCapture:
+    """
+    Appends every raw read (monotonic ns timestamp, kind, pin, value) to a
+    pre-allocated memory-mapped ring file of capacity records, 16 bytes
+    each. A write is two struct.pack_into calls on the mapping: no
+    allocation, no system call; the OS writes the pages back. Once full,
+    the oldest records are overwritten. Values are the reads as pyfirmata
+    returns them: analogs a fraction 0..1, digitals 0 or 1.
+    Reopening a file of the same capacity appends after its records.
+    Timestamps come from clock.monotonic_ns(), the time module by default.
+    Safe for one writer thread; readers (see read_capture) may map the
+    file at any time.
+    """
+
+    def __init__(self, path, capacity=1 << 22, clock=time):
+        self.path = path
+        self.capacity = capacity
+        self.clock = clock
+        size = HEADER.size + capacity * RECORD.size
+        resume = os.path.exists(path) and os.path.getsize(path) == size
+        self.file = open(path, 'r+b' if resume else 'w+b')
+        if not resume:
+            self.file.truncate(size)
+        self.map = mmap.mmap(self.file.fileno(), size)
+        magic, cap, count = HEADER.unpack_from(self.map)
+        if magic != MAGIC or cap != capacity:
+            count = 0
+        self.count = count
+        HEADER.pack_into(self.map, 0, MAGIC, capacity, count)
+
+    def write(self, kind, pin, value, ns=None):
+        """
+        appends one raw read, kind is ANALOG or DIGITAL, taken at ns
+        (monotonic), by default now.
+        """
+        if ns is None:
+            ns = self.clock.monotonic_ns()
+        offset = HEADER.size + self.count % self.capacity * RECORD.size
+        RECORD.pack_into(self.map, offset, ns, kind, pin, value)
+        self.count += 1
+        HEADER.pack_into(self.map, 0, MAGIC, self.capacity, self.count)
+
+    def flush(self):
+        self.map.flush()
+
+    def close(self):
+        self.map.flush()
+        self.map.close()
+        self.file.close()
+
+
+def read_capture(path):
+    """
+    RETURNS: a list of structured NumPy arrays of DTYPE (fields ns, kind,
+    pin, value) which together hold the records of the file oldest first:
+    one array, or two once the ring wrapped. The arrays are views of the
+    read-only mapping, nothing is copied; np.concatenate them for one
+    array. The newest record may be torn while a writer is running.
+    """
+    with open(path, 'rb') as f:
+        buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    magic, capacity, count = HEADER.unpack_from(buf)
+    if magic != MAGIC:
+        raise ValueError(f'{path} is not a capture file')
+    records = np.frombuffer(buf, DTYPE, capacity, HEADER.size)
+    if count <= capacity:
+        return [records[:count]]
+    head = count % capacity
+    return [records[head:], records[:head]]
+
+
+def pin_series(path, kind, pin):
+    """
+    RETURNS: (ns, values) arrays of one pin, oldest first, eg
+    pin_series('capture.bin', ANALOG, 1). Selecting a pin copies.
+    """
+    records = np.concatenate(read_capture(path))
+    mine = records[(records['kind'] == kind) & (records['pin'] == pin)]
+    return mine['ns'], mine['value']
@@ -0,0 +1,64 @@
+# file: clock.py
+
+import time
+import asyncio
+import datetime
+
+
+class SystemClock:
+    """
+    The clock of ArduinoSignalProcessor: every wait and deadline of the
+    sampling goes through it, so a VirtualClock can replace it.
+    """
+
+    def monotonic(self):
+        return time.monotonic()
+
+    def monotonic_ns(self):
+        return time.monotonic_ns()
+
+    def time(self):
+        return time.time()
+
+    def now(self):
+        return datetime.datetime.now()
+
+    def sleep(self, secs):
+        time.sleep(secs)
+
+    async def sleep_async(self, secs):
+        await asyncio.sleep(secs)
+
+
+class VirtualClock(SystemClock):
+    """
+    Simulated time: sleep() advances the clock at once instead of waiting,
+    so sampling runs as fast as the cpu allows. Monotonic time starts at 0,
+    wall time at epoch (a datetime).
+    """
+
+    def __init__(self, epoch=datetime.datetime(2021, 1, 1)):
+        self.epoch = epoch.timestamp()
+        self.t = 0.0
+
+    def monotonic(self):
+        return self.t
+
+    def monotonic_ns(self):
+        return round(self.t * 1e9)
+
+    def time(self):
+        return self.epoch + self.t
+
+    def now(self):
+        return datetime.datetime.fromtimestamp(self.time())
+
+    def sleep(self, secs):
+        self.t += max(secs, 0)
+
+    async def sleep_async(self, secs):
+        self.sleep(secs)
+        await asyncio.sleep(0)   # still let other tasks run
+
+
+system = SystemClock()
@@ -0,0 +1,161 @@
+# file: compression.py
+
+
+class SwingingDoor:
+    """
+    Swinging door trending for one signal, as used by process historians.
+    The door hinges on the last archived point, deviation above and below
+    it. Each point narrows the door to the slopes from the hinge that stay
+    within deviation of it. A point whose own slope falls outside the door
+    of the points before it closes the door: the point before is the last
+    one the straight line from the hinge can stand for within deviation,
+    so it is archived and becomes the new hinge.
+    """
+
+    def __init__(self, deviation):
+        self.deviation = deviation
+
+    def restart(self, t, v):
+        """ hinges the door on the archived point (t, v) """
+        self.t0, self.v0 = t, v
+        self.upper = float('inf')    # smallest slope to the upper bounds
+        self.lower = float('-inf')   # largest slope to the lower bounds
+
+    def closes(self, t, v):
+        """
+        tests the point (t, v) against the door, then narrows the door by it.
+        RETURNS: True when the door closed, ie the previous point must be
+        archived and the door restarted from it; the door is left as it was.
+        """
+        dt = t - self.t0
+        if dt <= 0:
+            return False
+        if not self.lower <= (v - self.v0) / dt <= self.upper:
+            return True
+        self.upper = min(self.upper, (v + self.deviation - self.v0) / dt)
+        self.lower = max(self.lower, (v - self.deviation - self.v0) / dt)
+        return False
+
+    def estimate(self, t, t1, v1):
+        """ value at t on the line from the hinge to the point (t1, v1) """
+        if t1 == self.t0:
+            return self.v0
+        return self.v0 + (v1 - self.v0) * (t - self.t0) / (t1 - self.t0)
+
+
+class Deadband:
+    """
+    Plain deadband: a point is archived when it moves more than deviation
+    from the last archived value, which is held until then.
+    """
+
+    def __init__(self, deviation):
+        self.deviation = deviation
+
+    def restart(self, t, v):
+        self.t0, self.v0 = t, v
+
+    def exceeds(self, v):
+        return abs(v - self.v0) > self.deviation
+
+    def estimate(self, t, t1, v1):
+        return self.v0
+
+
+class RecordCompressor:
+    """
+    Compresses the wide records of the sampler (one value per pin) before
+    they are uploaded. Each pin has its own SwingingDoor or Deadband with
+    its own deviation; when any pin needs a point archived, the whole record
+    is archived and every pin restarts from it. Archiving more often than a
+    single pin needs only shortens that pin's segments, so each pin still
+    rebuilds within its deviation by linear interpolation (swinging door)
+    or by holding the last value (deadband); report() gives the actual
+    largest error.
+    A record is also archived when max_interval secs passed since the last
+    one, which bounds gaps in the db and the memory held for reporting.
+    """
+
+    def __init__(self, deviations, method='swinging_door', max_interval=3600):
+        if method not in ('swinging_door', 'deadband'):
+            raise ValueError(f'unknown compression: {method}')
+        self.method = method
+        door = SwingingDoor if method == 'swinging_door' else Deadband
+        self.doors = {name: door(dev) for name, dev in deviations.items()}
+        self.max_interval = max_interval
+        self.received = self.archived = 0
+        self.max_error = dict.fromkeys(deviations, 0)
+        self.segment = []    # records received since the archived one
+        self.last = None     # (t, dts, state) of the newest record
+
+    def add(self, dts, state):
+        """
+        dts is the datetime of the record, state a dict of pin: value.
+        RETURNS: list of (datetime, state) records to upload, oldest first.
+        """
+        t = dts.timestamp()
+        record = (t, dts, dict(state))
+        self.received += 1
+        if self.last is None:
+            return self.archive(record)
+
+        archive = []
+        if self.method == 'swinging_door':
+            # a list, not a generator: every door is narrowed by the record
+            if any([door.closes(t, state[name])
+                    for name, door in self.doors.items()]):
+                archive = self.archive(self.last)
+                for name, door in self.doors.items():
+                    door.closes(t, state[name])
+            self.segment.append(record)
+            # the record is inside every door, so the line to it holds
+            if t - self.segment_start >= self.max_interval:
+                archive += self.archive(record)
+        elif t - self.segment_start >= self.max_interval or any(
+                door.exceeds(state[name])
+                for name, door in self.doors.items()):
+            archive = self.archive(record)
+        else:
+            self.segment.append(record)
+        self.last = record
+        return archive
+
+    def flush(self):
+        """
+        RETURNS: the newest record if it was not archived yet, so the tail
+        of the signal is stored too, eg at shutdown.
+        """
+        if self.segment:
+            return self.archive(self.segment[-1])
+        return []
+
+    def archive(self, record):
+        """
+        archives record, measures the error of the records it replaces and
+        restarts every pin from it.
+        """
+        t1, dts, state = record
+        if self.segment and self.segment[-1] is record:
+            self.segment.pop()
+        for t, _, s in self.segment:
+            if t > t1:
+                break
+            for name, door in self.doors.items():
+                error = abs(s[name] - door.estimate(t, t1, state[name]))
+                self.max_error[name] = max(self.max_error[name], error)
+        self.segment = [r for r in self.segment if r[0] > t1]
+        for name, door in self.doors.items():
+            door.restart(t1, state[name])
+        self.segment_start = t1
+        self.last = record
+        self.archived += 1
+        return [(dts, state)]
+
+    def report(self):
+        """
+        RETURNS: dict of received and archived counts, their ratio and the
+        largest reconstruction error seen per pin.
+        """
+        return {'received': self.received, 'archived': self.archived,
+                'ratio': self.received / max(self.archived, 1),
+                'max_error': dict(self.max_error)}
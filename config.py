@@ -19,13 +19,111 @@ initial_db_interval = 60         # seconds
 
 initial_analog_num = 10
 
-analog_3sigma = 0   # to remove this constraint, set it to 0
+# floor of the measured 3 sigma envelope, 0: measurement only
+analog_3sigma = 0
+
+noise_min_samples = 10   # windows seen before the measured envelope is used
+
+#  historian compression before upload: 'swinging_door' | 'deadband' | None
+#  None saves a row whenever changed() says so.
+compression = None
+# A2D counts of error allowed
+compression_deviation = {"A1": 4, "D2": 0, "D3": 0}
+compression_max_interval = 3600  # seconds, a row is saved at least this often
 
 digital_num = 5
 
+digital_read_budget = 20    # max reads per window to settle a digital pin
+digital_time_budget = 2.0   # max seconds per window to settle digitals
+
+sample_interval = .1   # seconds between ticks of a sampling window
+
+#  Lookup for sample_interval, key: A2D  value: seconds. None keeps
+#  sample_interval fixed. Generate it with: python sampler.py --calibrate
+sample_interval_lookup = None
+
+#  calibration sweep, see ArduinoSignalProcessor.calibrate
+calibration_spacings = [.01, .02, .05, .1]        # seconds between reads
+calibration_counts = [5, 10, 25, 50, 75, 100]     # reads averaged
+calibration_repeats = 10          # smoothed values measured per setting, >= 2
+calibration_target_3sigma = 2.0   # A2D counts of noise allowed
+
+# streaming filter for analogs: 'mean' | 'ema' | 'median' | 'kalman'
+# mean and median use a window of analog_num samples
+analog_filter = 'mean'
+ema_alpha = .2        # weight of the newest sample
+kalman_q = .01        # process variance, counts^2
+kalman_r = 4.0        # A2D measurement variance, counts^2
+
 usb_port = '/dev/cu.usbmodem14301'
 
+#  'poll': windows read the pins every sample_interval.
+#  'events': windows take every analog report the board sends, without
+#  sleeping; set firmata_sampling_interval to the report rate wanted.
+sampling_mode = 'poll'
+firmata_sampling_interval = 19   # ms between analog reports, None: default
+
+#  raw capture: every read is appended to a memory-mapped ring file for
+#  offline analysis, see capture.py. None: off. With several boards, give
+#  each board its own capture_path.
+capture_path = None           # eg 'capture.bin'
+capture_records = 1 << 22     # 16 bytes each: 64MB, ~19 h of 6 pins at 10 Hz
+
+#  multi-board: python supervisor.py samples every board listed here from one
+#  process. Each entry overrides the settings of this file for its board;
+#  every board needs its own src.
+boards = [
+    {"usb_port": usb_port, "src": src, "input_names": input_names},
+]
+board_retry_secs = 10   # a failing board is reopened after this many seconds
+
 db_url = 'http://127.0.0.1:8000/pins/'
+wire_format = 'json'   # or 'binary': 22 byte records, see serializer.py
+
+#  'wide': every record posts all input_names as one pins row.
+#  'narrow': a record posts only the pins changed since the last one, one
+#  (src, pin, ts, value) row each, to the narrow urls; GET /pin_values
+#  rebuilds wide rows. Fewer rows on quiet pins, and adding a pin to
+#  input_names needs no schema change. Always json.
+storage_mode = 'wide'
+narrow_db_url = 'http://127.0.0.1:8000/pin_values'
+narrow_db_batch_url = 'http://127.0.0.1:8000/pin_values/batch'
+
+#  uploads are queued and posted by uploader.Uploader on its own thread
+#  bulk endpoint, one post per batch; None posts each record to db_url
+db_batch_url = 'http://127.0.0.1:8000/pins/batch'
+upload_batch_size = 50     # flush when this many records are queued
+upload_max_age = 5.0       # or when the oldest has waited this many seconds
+upload_retries = 5
+upload_backoff = .5        # seconds, doubled on every retry
+upload_pool_size = 4       # keep-alive connections
+
+#  every record is written to a local spool before upload and replayed from
+#  it after a restart or while the server is down. None: memory queue only.
+spool_dir = 'spool'
+spool_segment_bytes = 1 << 20   # a new segment file every MB
+spool_fsync_every = 20          # records, or
+spool_fsync_secs = 1.0          # seconds between fsyncs
+replay_rate = 200               # max records per second sent to the server
+
+#  the sampler writes its metrics (see metrics.py) and uploader stats here
+#  every status_interval seconds. None: no status file.
+status_path = 'sampler_status.json'
+status_interval = 10
+#  server: sql_app/main.py keeps at most db_pool_size sqlite connections,
+#  each opened with these pragmas (see sql_app/storage.py)
+db_pool_size = 4
+sqlite_pragmas = {
+    "journal_mode": "WAL",      # readers do not block the writer
+    "synchronous": "NORMAL",    # fsync at checkpoints, not every commit
+    "mmap_size": 256 << 20,     # bytes
+    "cache_size": -16000,       # KiB per connection
+    "busy_timeout": 5000,       # ms
+}
+#  GET /pins and /pins/aggregate answer If-None-Match with 304 and keep the
+#  last encoded responses, at most this many and this many bytes in all
+response_cache_entries = 32
+response_cache_bytes = 64 << 20
 # following is for info only. Change it for your path. The actual path is determined by startup of server.  # noqa: E501
 db_file_path = '/Users/garth/Programming/python3/py3-arduino_fastapi_GuI/sql_app/signals.db'  # noqa: E501
 
@@ -0,0 +1,239 @@
+# file: filters.py
+
+from array import array
+
+
+class RollingMean:
+    """
+    Mean of the last size samples held in an array-backed ring buffer.
+    update() is O(1): the oldest sample is subtracted from a running total
+    as the newest is added. The total is recomputed from the buffer each
+    time the ring wraps so float round-off cannot accumulate.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.reset()
+
+    def reset(self):
+        self.buf = array('d', [0.0] * self.size)
+        self.idx = self.count = 0
+        self.total = 0.0
+        self.value = 0
+
+    def update(self, x):
+        if self.count == self.size:
+            self.total -= self.buf[self.idx]
+        else:
+            self.count += 1
+        self.buf[self.idx] = x
+        self.total += x
+        self.idx = (self.idx + 1) % self.size
+        if self.idx == 0:
+            self.total = sum(self.buf)
+        self.value = self.total / self.count
+        return self.value
+
+    def resize(self, size):
+        """
+        keeps the newest min(size, count) samples. O(size), so only
+        called when analog_num changes, never per sample.
+        """
+        _resize(self, size)
+
+
+def _resize(ring, size):
+    """ refills a ring filter with its newest min(size, count) samples """
+    if size == ring.size:
+        return
+    n = min(size, ring.count)
+    newest = [ring.buf[(ring.idx - n + i) % ring.size] for i in range(n)]
+    ring.size = size
+    ring.reset()
+    for x in newest:
+        ring.update(x)
+
+
+class EMA:
+    """
+    Exponential moving average: value += alpha * (x - value).
+    The first sample seeds the average.
+    """
+
+    def __init__(self, alpha):
+        self.alpha = alpha
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self.value = 0
+
+    def update(self, x):
+        if self.count == 0:
+            self.value = x
+        else:
+            self.value += self.alpha * (x - self.value)
+        self.count += 1
+        return self.value
+
+
+class RunningMedian:
+    """
+    Median of the last size samples. Samples are binned into integer
+    levels (A2D counts 0-1023), so a histogram replaces the sorted window:
+    add/remove are O(1) and the median bin only walks across empty bins,
+    never across the window. Returns the lower median.
+    """
+
+    def __init__(self, size, levels=1024):
+        self.size = size
+        self.levels = levels
+        self.reset()
+
+    def reset(self):
+        self.buf = array('i', [0] * self.size)
+        self.hist = array('i', [0] * self.levels)
+        self.idx = self.count = 0
+        self.m = self.below = 0   # median bin, samples below the median bin
+        self.value = 0
+
+    def update(self, x):
+        x = min(max(int(round(x)), 0), self.levels - 1)
+        if self.count == self.size:
+            old = self.buf[self.idx]
+            self.hist[old] -= 1
+            if old < self.m:
+                self.below -= 1
+        else:
+            self.count += 1
+        self.buf[self.idx] = x
+        self.hist[x] += 1
+        if x < self.m:
+            self.below += 1
+        self.idx = (self.idx + 1) % self.size
+
+        k = (self.count + 1) // 2
+        while self.below + self.hist[self.m] < k:
+            self.below += self.hist[self.m]
+            self.m += 1
+        while self.below >= k:
+            self.m -= 1
+            self.below -= self.hist[self.m]
+        self.value = self.m
+        return self.value
+
+    def resize(self, size):
+        _resize(self, size)
+
+
+class Kalman:
+    """
+    Scalar Kalman filter for a slowly varying level.
+    q is the process variance (how fast the true level may move),
+    r is the measurement variance (A2D noise), both in counts squared.
+    """
+
+    def __init__(self, q, r):
+        self.q = q
+        self.r = r
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self.value = 0
+        self.p = self.r
+
+    def update(self, x):
+        if self.count == 0:
+            self.value = x
+        else:
+            self.p += self.q
+            gain = self.p / (self.p + self.r)
+            self.value += gain * (x - self.value)
+            self.p *= 1 - gain
+        self.count += 1
+        return self.value
+
+
+def make_filter(kind, size, ema_alpha=.2, kalman_q=.01, kalman_r=4.0):
+    """
+    RETURNS: a streaming filter for an analog pin.
+    kind is one of 'mean', 'ema', 'median', 'kalman'.
+    size is the window for mean and median, usually analog_num.
+    """
+    if kind == 'mean':
+        return RollingMean(size)
+    elif kind == 'ema':
+        return EMA(ema_alpha)
+    elif kind == 'median':
+        return RunningMedian(size)
+    elif kind == 'kalman':
+        return Kalman(kalman_q, kalman_r)
+    raise ValueError(f'unknown analog_filter: {kind}')
+
+
+class Debouncer:
+    """
+    State machine debouncer for a digital pin, kept between windows.
+    A new level is accepted after num consecutive equal reads; until then
+    value stays at the last-known-good level and bouncing is True.
+    update() is O(1) and never loops, so callers bound the work by how
+    many reads they feed it. bounces counts the candidate levels that
+    reverted before they settled; a clean change of level is no bounce.
+    """
+
+    def __init__(self, num, value=0):
+        self.num = num
+        self.value = value
+        self.candidate = value
+        self.run = num   # the initial value counts as settled
+        self.bounces = 0
+
+    @property
+    def bouncing(self):
+        return self.run < self.num
+
+    def update(self, bit):
+        if bit == self.candidate:
+            self.run += 1
+        else:
+            if self.bouncing:   # the pending level reverted unsettled
+                self.bounces += 1
+            self.candidate = bit
+            self.run = 1
+        if self.run >= self.num:
+            self.value = self.candidate
+        return self.value
+
+
+class RunningStats:
+    """
+    Welford's running mean and variance, O(1) per sample and numerically
+    stable for long runs.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def update(self, x):
+        self.count += 1
+        delta = x - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (x - self.mean)
+        return self.mean
+
+    @property
+    def variance(self):
+        """ sample variance, 0 until two samples were seen """
+        if self.count < 2:
+            return 0.0
+        return self.m2 / (self.count - 1)
+
+    @property
+    def std(self):
+        return self.variance ** .5
@@ -0,0 +1,145 @@
+# file: metrics.py
+
+import os
+import json
+import time
+import bisect
+import threading
+import contextlib
+
+# upper bounds in secs, from 50 usec (a cached pin read) to 10 secs
+LATENCY_BUCKETS = (.00005, .0001, .00025, .0005, .001, .0025, .005, .01,
+                   .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+
+
+class Counter:
+    """ a count that only goes up """
+
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self.value = 0
+        self.lock = threading.Lock()
+
+    def inc(self, n=1):
+        with self.lock:
+            self.value += n
+
+    def render(self):
+        return [f'# HELP {self.name} {self.help}',
+                f'# TYPE {self.name} counter',
+                f'{self.name} {self.value}']
+
+    def snapshot(self):
+        return self.value
+
+
+class Histogram:
+    """
+    Fixed-bucket histogram: observe() is a bisect and three additions,
+    no allocation, so it can time every pin read.
+    """
+
+    def __init__(self, name, help, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)   # the last is +Inf
+        self.sum = 0.0
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+
+    @contextlib.contextmanager
+    def time(self):
+        """ observes the secs the with block took """
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - t0)
+
+    def quantile(self, q):
+        """
+        RETURNS: the upper bound of the bucket holding the q quantile,
+        None without observations or when it is above the last bucket.
+        """
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, n in zip(self.buckets, self.counts):
+            seen += n
+            if seen >= rank:
+                return bound
+        return None
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}',
+                 f'# TYPE {self.name} histogram']
+        seen = 0
+        for bound, n in zip(self.buckets + ('+Inf',), self.counts):
+            seen += n
+            lines.append(f'{self.name}_bucket{{le="{bound}"}} {seen}')
+        lines.append(f'{self.name}_sum {self.sum}')
+        lines.append(f'{self.name}_count {self.count}')
+        return lines
+
+    def snapshot(self):
+        return {'count': self.count, 'sum': self.sum,
+                'p50': self.quantile(.5), 'p99': self.quantile(.99)}
+
+
+class Registry:
+    """
+    The metrics of one process by name. counter() and histogram() return
+    the existing metric of that name, so modules can share one.
+    """
+
+    def __init__(self):
+        self.metrics = {}
+        self.lock = threading.Lock()
+
+    def get(self, cls, name, *args):
+        with self.lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = self.metrics[name] = cls(name, *args)
+            return metric
+
+    def counter(self, name, help):
+        return self.get(Counter, name, help)
+
+    def histogram(self, name, help, buckets=LATENCY_BUCKETS):
+        return self.get(Histogram, name, help, buckets)
+
+    def render(self):
+        """ RETURNS: every metric in the Prometheus text format """
+        lines = []
+        for metric in list(self.metrics.values()):
+            lines += metric.render()
+        return '\n'.join(lines) + '\n'
+
+    def snapshot(self):
+        """ RETURNS: dict of name: count, or histogram count, sum, p50, p99 """
+        return {name: m.snapshot() for name, m in list(self.metrics.items())}
+
+    def write_status(self, path, **extra):
+        """
+        writes snapshot() and extra, eg uploader stats, as json to path.
+        The file is replaced atomically, so readers never see half of it.
+        """
+        tmp = path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({'time': time.time(), **extra,
+                       'metrics': self.snapshot()}, f, indent=1)
+        os.replace(tmp, path)
+
+
+registry = Registry()
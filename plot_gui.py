@@ -2,12 +2,17 @@
 
 import PySimpleGUI as sg
 import requests
+import numpy as np
 import matplotlib.pyplot as plt
+import matplotlib.dates as mdates
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg, NavigationToolbar2Tk  # noqa: E501
 import matplotlib.patches as mpatches
+import serializer
+import config
 from passlib.context import CryptContext
 from jose import JWTError, jwt
 import pdb
+from collections import OrderedDict
 # ------------------------------- This is to include a matplotlib figure in a Tkinter canvas  # noqa: E501
 
 
@@ -49,37 +54,99 @@ def my_sort(e):
 #  'raw',0
 
 
+# (url, params): last response, revalidated by its ETag. An LRU of at most
+# MAX_RESPONSES, as sql_app/cache.py: every page of a read has its own key
+MAX_RESPONSES = 16
+responses = OrderedDict()
+
+
+def get(url, headers_dict, params):
+    '''
+    GETs url, sending the ETag of the last response to the same request as
+    If-None-Match, so an unchanged table costs the server an index lookup.
+    RETURNS: the last response again on 304 Not Modified, else the new one.
+    SIDE_EFFECT: keeps the response in responses, dropping the least
+    recently used past MAX_RESPONSES.
+    '''
+    key = (url, tuple(sorted(params.items())))
+    last = responses.get(key)
+    if last is not None:
+        responses.move_to_end(key)
+    headers = dict(headers_dict)
+    if last is not None:
+        headers['If-None-Match'] = last.headers['ETag']
+    response = requests.get(url, headers=headers, params=params)
+    if response.status_code == 304 and last is not None:
+        return last
+    if response.ok and 'ETag' in response.headers:
+        responses[key] = response
+        responses.move_to_end(key)
+        while len(responses) > MAX_RESPONSES:
+            responses.popitem(last=False)
+    return response
+
+
+def read_columns(headers_dict, page_size=10000,
+                 url='http://127.0.0.1:8000/pins', **params):
+    '''
+    RETURNS: (columns, last response). columns is a dict of name: numpy
+    array of every record of GET url, /pins or /pin_values, in the
+    columnar binary format, read page by page following X-Next-Cursor: ts
+    datetime64, analogs and digitals float32 with NaN for missing values.
+    '''
+    pages = []
+    params.update(limit=page_size, format='binary')
+    while True:
+        response = get(url, headers_dict, params)
+        if not response.ok:
+            break
+        pages.append(serializer.decode_columns(response.content))
+        cursor = response.headers.get('X-Next-Cursor')
+        if cursor is None:
+            break
+        params['after'] = cursor
+    if len(pages) == 1:
+        return pages[0], response
+    return {name: np.concatenate([p[name] for p in pages])
+            for name in (pages[0] if pages else [])}, response
+
+
 def do_plot(how, many):
+    """
+    how is 'raw': every record, or 'avg': one row per bucket of many,
+    eg 10s, 5m, 1h, downsampled by the server (GET /pins/aggregate).
+    """
     headers_dict = {"Authorization": "Bearer garth",
                     "accept": "application/json"}
-    response = requests.get('http://127.0.0.1:8000/pins',
-                            headers=headers_dict)
-    a1 = d2 = d3 = 0
+    if how == 'avg':
+        response = get('http://127.0.0.1:8000/pins/aggregate', headers_dict,
+                       {'bucket': many})
+        pins = response.json() if response.ok else []
+    else:
+        url = 'http://127.0.0.1:8000/pins'
+        if getattr(config, 'storage_mode', 'wide') == 'narrow':
+            url = 'http://127.0.0.1:8000/pin_values'   # wide rows rebuilt
+        columns, response = read_columns(headers_dict, url=url)
+    ts = a1 = d2 = d3 = []
     if response.ok:
-        pins = response.json()
-        num = len(pins)
-        pins.sort(key=my_sort)
-        date = pins[0]['ts'][0:10]
-        window['-Date-'].update(f'Date: {date}')
-        window['-Samples-'].update(f'Samples: {num}')
-
-        # get raw numbers from the db
-        x1 = [p['ts'][11:19] for p in pins]
-        y1 = [p['A1'] for p in pins]
-        y2 = [p['D2'] for p in pins]
-        y3 = [p['D3'] for p in pins]
-
-        # smoothing
         if how == 'avg':
-            a1 = avg_by(y1, many)
-            ts = every_nth(x1, many)[:len(a1)]
-            d2 = every_nth(y2, many)[:len(a1)]
-            d3 = every_nth(y3, many)[:len(a1)]
-        else:
-            ts = x1
-            a1 = y1
-            d2 = y2
-            d3 = y3
+            num = sum(p['count'] for p in pins)
+            ts = np.array([p['bucket'] for p in pins], 'M8[s]')
+            a1 = [p['A1_mean'] for p in pins]
+            d2 = [p['D2_last'] for p in pins]
+            d3 = [p['D3_last'] for p in pins]
+        elif columns:
+            num = len(columns['ts'])
+            ts = columns['ts']
+            # a pin never stored, eg in narrow mode, plots as no line
+            empty = np.full(num, np.nan, 'f4')
+            a1 = columns.get('A1', empty)
+            d2 = columns.get('D2', empty)
+            d3 = columns.get('D3', empty)
+        if len(ts):
+            date = str(ts[0])[0:10]
+            window['-Date-'].update(f'Date: {date}')
+            window['-Samples-'].update(f'Samples: {num}')
 
     fig, ax = plt.subplots()
     DPI = fig.get_dpi()
@@ -107,7 +174,8 @@ def do_plot(how, many):
 
     color = 'tab:green'
     ax2.plot(ts, d3, color=color)
-    ax2.xaxis.set_major_locator(plt.MultipleLocator(round(len(ts) / 7)))
+    ax2.xaxis.set_major_locator(mdates.AutoDateLocator(maxticks=7))
+    ax2.xaxis.set_major_formatter(mdates.DateFormatter('%H:%M:%S'))
     green_patch = mpatches.Patch(color='green')
     plt.sca(ax)
     fig.tight_layout()
@@ -140,35 +208,45 @@ class Toolbar(NavigationToolbar2Tk):
 
 # ------------------------------- PySimpleGUI CODE
 
-layout = [
-    [sg.T('Graph: Arduino Pins')],
-    [sg.B('Plot'), sg.T('num:'), sg.Input("", size=(5, 1), key='-Num-'),
-     sg.B('Plot_Avg'), sg.B('Exit')],
-    [sg.T('Controls:')],
-    [sg.Canvas(key='controls_cv')],
-    [sg.T('Figure:'), sg.T('', key='-Date-'), sg.T('', key='-Samples-')],
-    [sg.Column(
-        layout=[
-            [sg.Canvas(key='fig_cv',
-                       # it's important that you set this size
-                       size=(400 * 2, 400)
-                       )]
-        ],
-        background_color='#DAE0E6',
-        pad=(0, 0)
-    )],
-    # [sg.B('Alive?')
-]
-
-window = sg.Window('Graph with controls', layout)
-
-while True:
-    event, values = window.read()
-    print(event, values)
-    if event in (sg.WIN_CLOSED, 'Exit'):  # always,  always give a way out!
-        break
-    if event == 'Plot':
-        do_plot('raw', 0)
-    if event == 'Plot_Avg':
-        do_plot('avg', int(values['-Num-']))
-window.close()
+
+def main():
+    global window
+    narrow = getattr(config, 'storage_mode', 'wide') == 'narrow'
+    layout = [
+        [sg.T('Graph: Arduino Pins')],
+        [sg.B('Plot'), sg.T('bucket:'),
+         sg.Input("1m", size=(5, 1), key='-Num-'),
+         # /pins/aggregate reads the wide pins table only
+         sg.B('Plot_Avg', disabled=narrow), sg.B('Exit')],
+        [sg.T('Controls:')],
+        [sg.Canvas(key='controls_cv')],
+        [sg.T('Figure:'), sg.T('', key='-Date-'), sg.T('', key='-Samples-')],
+        [sg.Column(
+            layout=[
+                [sg.Canvas(key='fig_cv',
+                           # it's important that you set this size
+                           size=(400 * 2, 400)
+                           )]
+            ],
+            background_color='#DAE0E6',
+            pad=(0, 0)
+        )],
+        # [sg.B('Alive?')
+    ]
+
+    window = sg.Window('Graph with controls', layout)
+
+    while True:
+        event, values = window.read()
+        print(event, values)
+        if event in (sg.WIN_CLOSED, 'Exit'):  # always,  always give a way out!
+            break
+        if event == 'Plot':
+            do_plot('raw', 0)
+        if event == 'Plot_Avg':
+            do_plot('avg', values['-Num-'])
+    window.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -2,20 +2,147 @@
 
 import config 
 import signal_processor as p
+import uploader as u
+import spool as s
+import metrics
 from pyfirmata import Arduino, util
 import datetime
+import os
 import time
+import threading
 import requests
+from types import MappingProxyType
 
 sigproc = p.ArduinoSignalProcessor()
 
+# latest record published by the sampling thread. It is replaced, never
+# mutated, so readers on other threads need no lock.
+snapshot = None
+stopping = threading.Event()
+thread = None
+uploader = None
+# the exception of the last window, None once a window succeeds again
+error = None
+RETRY_SECONDS = 1   # wait after a failed window
+# written by calibrate(), next to this module whatever the working directory
+CALIBRATION_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                'calibration.py')
+
 
 def initialize():
     sigproc.initialize(config, Arduino, util, time.time())
+    sigproc.uploader = initialize_uploader()
     print(f'Started sampling at: {str(time.ctime())}')
 
 
+def initialize_uploader():
+    '''
+    RETURNS: the started uploader of this process, with its spool when
+    config.spool_dir is set. Shared by every board of a supervisor.
+    '''
+    global uploader
+    spool = None
+    if config.spool_dir is not None:
+        spool = s.Spool(config.spool_dir, config.spool_segment_bytes,
+                        config.spool_fsync_every, config.spool_fsync_secs)
+        print(f'{spool.pending()} spooled records to replay')
+    url, batch_url = config.db_url, config.db_batch_url
+    if getattr(config, 'storage_mode', 'wide') == 'narrow':
+        url, batch_url = config.narrow_db_url, config.narrow_db_batch_url
+    uploader = u.Uploader(url, batch_url,
+                          config.upload_batch_size, config.upload_max_age,
+                          config.upload_retries, config.upload_backoff,
+                          config.upload_pool_size, spool=spool,
+                          rate=config.replay_rate)
+    uploader.start()
+    return uploader
+
+
+def start():
+    '''
+    Starts the sampling and upload loop on a background daemon thread.
+    Call initialize() first.
+    '''
+    global thread
+    stopping.clear()
+    thread = threading.Thread(target=run, name='sampler', daemon=True)
+    thread.start()
+
+
+def stop(timeout=None):
+    '''
+    Asks the sampling thread to finish its current window and waits for it.
+    '''
+    stopping.set()
+    if thread is not None:
+        thread.join(timeout)
+    if uploader is not None:
+        uploader.stop(timeout)
+        print(f'uploads: {uploader.stats()}')
+
+
+def run():
+    '''
+    Sampling loop of the background thread: samples, uploads when changed
+    and publishes each record as the new snapshot until stop() is called.
+    A window that raises is printed and kept in error, and sampling is
+    tried again after RETRY_SECONDS; the snapshot goes stale meanwhile.
+    '''
+    global snapshot, error
+    status_due = time.monotonic()
+    while not stopping.is_set():
+        try:
+            snapshot = MappingProxyType(sample())
+            error = None
+        except Exception as e:
+            if error is None:
+                print(f'sampling failed: {e!r}')
+            error = e
+            stopping.wait(RETRY_SECONDS)
+            continue
+        if config.status_path and time.monotonic() >= status_due:
+            write_status()
+            status_due = time.monotonic() + config.status_interval
+    if sigproc.compressor is not None:
+        for rdts, state in sigproc.compressor.flush():
+            save(rdts, state)
+        print(f'compression: {sigproc.compressor.report()}')
+    if sigproc.capture is not None:
+        sigproc.capture.close()
+    if config.status_path:
+        write_status()
+
+
+def write_status():
+    '''
+    SIDE_EFFECT: writes the sampler's metrics (latency histograms, change
+    counters), the uploader stats and the latest record as json to
+    config.status_path, eg for: watch cat sampler_status.json
+    '''
+    metrics.registry.write_status(
+        config.status_path, snapshot=dict(snapshot or {}),
+        uploader=uploader.stats() if uploader is not None else None)
+
+
+def alive():
+    '''
+    RETURNS: True while the sampling thread runs and its last window
+    succeeded, so get_data() is fresh; see error for why it is not.
+    '''
+    return thread is not None and thread.is_alive() and error is None
+
+
 def get_data():
+    '''
+    RETURNS: the latest record published by the sampling thread, or None
+    before the first window completes. Never blocks; see sample() for
+    the record layout. The record is read-only and stale when not
+    alive().
+    '''
+    return snapshot
+
+
+def sample():
     '''
     RETURNS: a data record which is a dict with  a timestamp, ts, and however 
     many InputPins were specified in the config.py file. Each InputPin has 
@@ -27,15 +154,57 @@ def get_data():
     ....digital signal transition (1->0 or 0->1)
     ....time from the last db save in seconds
     These values are specified in the config.py file. 
-    This function is called upon a timeout in the GUI window.read(...).
-    So the GUI is updated every time it calls processor.get_data() but the 
-    db is updated only when it is called by the GUI AND 
-    change criteria are met.
+    This function is called in a loop by the sampling thread, which
+    publishes each record for get_data(). So the GUI is never blocked by
+    sampling, and the db is updated only when change criteria are met.
     '''
     sigproc.collect_inputs()
     dts = datetime.datetime.now()
-    if sigproc.changed(dts.timestamp()):
-        response = sigproc.update_db(dts)
-        if response.ok:
-            print(f'OK: {response.json()}')
+    if sigproc.compressor is not None:
+        for rdts, state in sigproc.compress(dts):
+            save(rdts, state)
+    elif sigproc.changed(dts.timestamp()):
+        save(dts)
     return {**sigproc.current_state, "ts": str(dts)}
+
+
+def save(dts, state=None):
+    try:
+        response = sigproc.update_db(dts, state)
+        if response is not None and response.ok:
+            print(f'OK: {response.json()}')
+    except requests.exceptions.RequestException as e:
+        print(f'db update failed: {e}')
+
+
+def calibrate(path=CALIBRATION_PATH):
+    '''
+    Runs the calibration sweep from config.py on the analog pins, prints the
+    noise report and writes the lookups found to path.
+    Run it with a steady signal on the pins:
+        python sampler.py --calibrate [path]
+    '''
+    calibration = sigproc.calibrate(config.calibration_spacings,
+                                    config.calibration_counts,
+                                    config.calibration_repeats,
+                                    config.calibration_target_3sigma)
+    for r in calibration['report']:
+        print(f"{r['pin']} spacing:{r['spacing']} count:{r['count']} "
+              f"level:{r['level']:.1f} 3sigma:{r['sigma3']:.2f} "
+              f"secs:{r['secs']:.2f}")
+    with open(path, 'w') as f:
+        f.write(sigproc.format_lookups(calibration))
+    print(f'lookups written to: {path}')
+
+
+if __name__ == '__main__':
+    # headless: python sampler.py [--calibrate [path]]
+    import sys
+    initialize()
+    try:
+        if '--calibrate' in sys.argv:
+            calibrate(*sys.argv[sys.argv.index('--calibrate') + 1:][:1])
+        else:
+            run()
+    finally:
+        stop()
@@ -0,0 +1,215 @@
+# file: serializer.py
+
+import json
+import struct
+import datetime
+from operator import itemgetter
+import numpy as np
+
+# Compact binary record, little-endian, fixed layout:
+#   ts      float64  epoch seconds, a naive datetime read as UTC
+#   src     8 bytes  ascii, NUL padded, at most 8 characters
+#   present uint8    bit i set when column i of BINARY_COLUMNS has a value
+#   A0, A1  int16    A2D counts
+#   digital uint8    bit i is the value of BINARY_DIGITALS[i]
+# Records may be concatenated. Must agree with the pins table of the server.
+BINARY_ANALOGS = ('A0', 'A1')
+BINARY_DIGITALS = ('D2', 'D3')
+BINARY_COLUMNS = BINARY_ANALOGS + BINARY_DIGITALS
+SRC_BYTES = 8
+BINARY_RECORD = struct.Struct(f'<d{SRC_BYTES}sB{len(BINARY_ANALOGS)}hB')
+BINARY_MEDIA_TYPE = 'application/octet-stream'
+
+# Columnar binary, for reading many records: a uint32 length, a json
+# header {"rows": n, "columns": [{"name", "dtype", "offset"[, "categories"]}]},
+# then each column as one packed little-endian array of numpy dtype, at
+# offset bytes (8 byte aligned) after the header. 'category' columns are
+# uint32 codes into their categories (strings or null).
+COLUMNS_MEDIA_TYPE = 'application/x-pins-columns'
+COLUMNS_LENGTH = struct.Struct('<I')
+
+
+class RecordSerializer:
+    """
+    Encodes sampler records for the db. Built once from src and input_names,
+    so encoding a record only fills values into a prepared template:
+    no per-record string building and no key lookups by name.
+    json() gives the same text json_encode always produced.
+    binary() gives a BINARY_RECORD, about a third of the json size.
+    narrow_json() gives only the pins that changed, for narrow storage.
+    """
+
+    def __init__(self, src, input_names, binary=False):
+        self.src = src
+        self.input_names = list(input_names)
+        fields = ''.join(f',{literal(n)}: %d' for n in self.input_names)
+        self.template = '{"ts":"%s","src": ' + literal(src) + fields + '}'
+        self.narrow_template = ('{"ts":"%s","src": ' + literal(src)
+                                + ',"values": %s}')
+        getter = itemgetter(*self.input_names)
+        if len(self.input_names) == 1:
+            self.values = lambda state: (getter(state),)
+        else:
+            self.values = getter
+        self.binary_ok = all(n in BINARY_COLUMNS for n in self.input_names)
+        self.present = 0
+        if self.binary_ok:
+            self.present = sum(1 << BINARY_COLUMNS.index(n)
+                               for n in self.input_names)
+        # made on the first binary(), or here to fail early when binary
+        self.src_bytes = self.binary_src() if binary else None
+
+    def binary_src(self):
+        """
+        RETURNS: src as the src field of a BINARY_RECORD.
+        Raises ValueError when the binary format cannot hold the records:
+        a pin it has no column for, or a src that is not ascii or longer
+        than 8 bytes, which would be cut and could collide with another.
+        """
+        if not self.binary_ok:
+            raise ValueError(f'binary format has no column for some of '
+                             f'{self.input_names}, it has {BINARY_COLUMNS}')
+        try:
+            src = self.src.encode('ascii')
+        except UnicodeEncodeError:
+            raise ValueError(f'binary format needs an ascii src, '
+                             f'got {self.src!r}') from None
+        if len(src) > SRC_BYTES:
+            raise ValueError(f'binary format holds a src of at most '
+                             f'{SRC_BYTES} characters, got {self.src!r}')
+        return src
+
+    def json(self, ts, state):
+        """
+        ts is the timestamp string, state a dict holding every input_name.
+        RETURNS: json like
+            {"ts":"2021-01-01 00:00:00","src": "uno","A1": 997,...}
+        """
+        return self.template % (ts, *self.values(state))
+
+    def narrow_json(self, ts, state, saved):
+        """
+        ts is the timestamp string, state a dict holding every input_name,
+        saved a dict of the last value sent per pin, updated here.
+        RETURNS: json of only the pins whose value differs from saved, like
+        {"ts":"2021-01-01 00:00:00","src": "uno","values": {"D2": 1}},
+        or None when none does.
+        """
+        values = {}
+        for name, value in zip(self.input_names, self.values(state)):
+            value = int(value)
+            if saved.get(name) != value:
+                values[name] = saved[name] = value
+        if not values:
+            return None
+        return self.narrow_template % (ts, json.dumps(values))
+
+    def binary(self, dts, state):
+        """
+        dts is a datetime, state a dict holding every input_name.
+        RETURNS: bytes of one BINARY_RECORD.
+        """
+        if self.src_bytes is None:
+            self.src_bytes = self.binary_src()
+        analogs = [int(state.get(n) or 0) for n in BINARY_ANALOGS]
+        bits = 0
+        for i, n in enumerate(BINARY_DIGITALS):
+            if state.get(n):
+                bits |= 1 << i
+        return BINARY_RECORD.pack(utc_timestamp(dts), self.src_bytes,
+                                  self.present, *analogs, bits)
+
+
+def literal(s):
+    """ json string literal of s, escaped for use in a % template """
+    return json.dumps(s).replace('%', '%%')
+
+
+def utc_timestamp(dts):
+    """
+    RETURNS: epoch secs of the datetime dts. A naive dts, as the sampler
+    makes them, is read as UTC, so decode_binary gives back its str() on
+    a server in any timezone, as the json format stores it.
+    """
+    if dts.tzinfo is None:
+        dts = dts.replace(tzinfo=datetime.timezone.utc)
+    return dts.timestamp()
+
+
+def decode_binary(body):
+    """
+    body holds one or more concatenated BINARY_RECORDs.
+    RETURNS: list of dicts with ts (as str(datetime)), src and the columns
+    that were present.
+    """
+    if len(body) % BINARY_RECORD.size:
+        raise ValueError(f'binary body of {len(body)} bytes is not a whole '
+                         f'number of {BINARY_RECORD.size} byte records')
+    records = []
+    n = len(BINARY_ANALOGS)
+    for fields in BINARY_RECORD.iter_unpack(body):
+        ts, src, present = fields[:3]
+        bits = fields[-1]
+        dts = datetime.datetime.fromtimestamp(ts, datetime.timezone.utc)
+        record = {'ts': str(dts.replace(tzinfo=None)),
+                  'src': src.rstrip(b'\0').decode('ascii')}
+        for i, name in enumerate(BINARY_ANALOGS):
+            if present & (1 << i):
+                record[name] = fields[3 + i]
+        for i, name in enumerate(BINARY_DIGITALS):
+            if present & (1 << (n + i)):
+                record[name] = bool(bits & (1 << i))
+        records.append(record)
+    return records
+
+
+def encode_columns(columns):
+    """
+    columns is a dict of name: (dtype, values), dtype a little-endian numpy
+    dtype, eg '<f4' (None becomes NaN), '<M8[us]' from timestamp strings,
+    or 'category' for strings.
+    RETURNS: bytes in the columnar binary format.
+    """
+    header, arrays, offset = [], [], 0
+    rows = len(next(iter(columns.values()))[1]) if columns else 0
+    for name, (dtype, values) in columns.items():
+        if len(values) != rows:
+            raise ValueError(f'column {name} has {len(values)} values, '
+                             f'expected {rows}')
+        column = {'name': name, 'dtype': dtype, 'offset': offset}
+        if dtype == 'category':
+            codes = {}
+            array = np.array([codes.setdefault(v, len(codes)) for v in values],
+                             '<u4')
+            column['categories'] = list(codes)
+            column['dtype'] = array.dtype.str
+        else:
+            array = np.array(values, dtype)
+        header.append(column)
+        arrays.append(array.tobytes())
+        offset += -(-array.nbytes // 8) * 8
+    head = json.dumps({'rows': rows, 'columns': header}).encode()
+    body = [COLUMNS_LENGTH.pack(len(head)), head]
+    for data in arrays:
+        body += [data, bytes(-len(data) % 8)]
+    return b''.join(body)
+
+
+def decode_columns(body):
+    """
+    body is in the columnar binary format of encode_columns.
+    RETURNS: dict of name: numpy array. Arrays are read-only views of body,
+    but for category columns, which become object arrays of their strings.
+    """
+    (length,) = COLUMNS_LENGTH.unpack_from(body)
+    start = COLUMNS_LENGTH.size + length
+    header = json.loads(body[COLUMNS_LENGTH.size:start])
+    rows = header['rows']
+    columns = {}
+    for column in header['columns']:
+        array = np.frombuffer(body, column['dtype'], rows,
+                              start + column['offset'])
+        if 'categories' in column:
+            array = np.array(column['categories'], object)[array]
+        columns[column['name']] = array
+    return columns
@@ -2,9 +2,37 @@
 
 import pdb
 import time
+import itertools
+import queue
+import statistics
 import json
 import requests
 import datetime
+import filters
+import compression
+import serializer
+import capture
+import clock
+import metrics
+
+READ_SECONDS = metrics.registry.histogram(
+    'sampler_read_seconds', 'Latency of one pin read.')
+WINDOW_SECONDS = metrics.registry.histogram(
+    'sampler_window_seconds',
+    'Duration of a sampling window: reads and smoothing.')
+CHANGE_CHECKS = metrics.registry.counter(
+    'sampler_change_checks_total', 'Windows checked by changed().')
+CHANGES = metrics.registry.counter(
+    'sampler_changes_total', 'Windows changed() found worth saving.')
+POST_SECONDS = metrics.registry.histogram(
+    'sampler_post_seconds', 'Latency of one post to the db.')
+
+# Firmata protocol bytes, see listen_reports and set_firmata_interval
+ANALOG_MESSAGE = 0xE0
+DIGITAL_MESSAGE = 0x90
+SAMPLING_INTERVAL = 0x7A
+# one step of the 10 bit A2D: the smallest envelope, see envelope()
+A2D_QUANTUM = 1
 
 
 class InputPin:
@@ -14,6 +42,7 @@ class InputPin:
          updated with smoothed values,
          compared to former values
          encoded as json to persist to db.
+         smoothed sample by sample by an optional streaming filter.
          If pwm could be an input, also create a type "pwm" Later...
     """
 
@@ -25,10 +54,19 @@ class InputPin:
             self.sig_type = "digital"
         self.pin = int(name[1:])
         self.value = 0
+        self.filter = None
 
     def __repr__(self):
         return f'{self.sig_type } {self.pin} {self.value}'
 
+    def update(self, raw):
+        """
+        RETURNS: the smoothed value after adding one raw sample, O(1).
+        Without a filter the raw sample is passed through.
+        """
+        self.value = raw if self.filter is None else self.filter.update(raw)
+        return self.value
+
 
 class ArduinoSignalProcessor:
     """
@@ -38,8 +76,12 @@ class ArduinoSignalProcessor:
         3. detects when changes have occurred in signal values.
         4. marshals the changes into json for transmission to database via HTTP
         5. sends http request to save json to db.
+    Every wait and deadline goes through clock; set it to a
+    clock.VirtualClock before initialize() to run faster than real time.
     """
 
+    clock = clock.system
+
     def initialize(self, config, Arduino, util, timestamp):
         """
         config contains: input_names, analog_num, digital_num , usb_port, url,
@@ -57,7 +99,7 @@ class ArduinoSignalProcessor:
         self.board = Arduino(config.usb_port)
         thread = util.Iterator(self.board)
         thread.start()
-        time.sleep(1)
+        self.clock.sleep(1)
         print(f'board iterator thread is_alive: {thread.is_alive()}')
 
         self.src = config.src
@@ -65,18 +107,66 @@ class ArduinoSignalProcessor:
         self.analog_num_lookup = config.analog_num_lookup
         self.analog_num = config.initial_analog_num  # 10: averages 10 reads
         self.db_interval = config.initial_db_interval   # 60: saves ~every min
-        self.analog_3sigma = config.analog_3sigma  # when 0, has no effect
+        # floor of the noise envelope
+        self.analog_3sigma = config.analog_3sigma
+        self.noise_min_samples = getattr(config, 'noise_min_samples', 10)
         self.digital_num = config.digital_num  # if 5, requires 5 consecutive reads  # noqa: E501
+        # secs between ticks
+        self.sample_interval = getattr(config, 'sample_interval', .1)
+        self.sample_interval_lookup = getattr(
+            config, 'sample_interval_lookup', None)
+        # hard limits on the reads and secs spent settling digitals per window
+        self.digital_read_budget = getattr(
+            config, 'digital_read_budget', 4 * self.digital_num)
+        self.digital_time_budget = getattr(
+            config, 'digital_time_budget', 2.0)
         self.input_pins = config.input_names
         self.db_url = config.db_url
+        self.wire_format = getattr(config, 'wire_format', 'json')  # 'binary'
+        # 'narrow': records hold only the pins changed since the last one
+        self.storage_mode = getattr(config, 'storage_mode', 'wide')
+        self.narrow_saved = {}   # pin: last value encoded, see encode
+        if self.storage_mode == 'narrow':
+            self.db_url = config.narrow_db_url
+        self.uploader = None   # see update_db
+        # opt-in raw capture of every read to a memory-mapped ring file
+        self.capture = None
+        if getattr(config, 'capture_path', None):
+            self.capture = capture.RawCapture(
+                config.capture_path,
+                getattr(config, 'capture_records', 1 << 22), self.clock)
         self.apins = [InputPin(a) for a in self.input_pins if a.find("A") > -1]
+        self.analog_filter = getattr(config, 'analog_filter', 'mean')
+        # Welford stats of window to window steps of each analog, see noise()
+        self.noise_stats = {a.name: filters.RunningStats()
+                            for a in self.apins}
+        self.last_a2d = {}
+        for a in self.apins:
+            a.filter = filters.make_filter(
+                self.analog_filter, self.analog_num,
+                ema_alpha=getattr(config, 'ema_alpha', .2),
+                kalman_q=getattr(config, 'kalman_q', .01),
+                kalman_r=getattr(config, 'kalman_r', 4.0))
         self.dpins = [InputPin(d) for d in self.input_pins if d.find("D") > -1]
-        self.current_state = self.former_state = {}
+        for d in self.dpins:
+            d.filter = filters.Debouncer(self.digital_num)
+        self.current_state = {}
+        self.former_state = {}
         [self.current_state.update({p: InputPin(p).value})
          for p in self.input_pins]
         [self.former_state.update({p: InputPin(p).value})
          for p in self.input_pins]
+        self.serializer = serializer.RecordSerializer(
+            self.src, self.input_pins, self.wire_format == 'binary')
         self.db_file_path = config.db_file_path
+        # optional historian compression between collect_inputs and update_db
+        self.compressor = None
+        method = getattr(config, 'compression', None)
+        if method is not None:
+            deviations = getattr(config, 'compression_deviation', {})
+            self.compressor = compression.RecordCompressor(
+                {p: deviations.get(p, 0) for p in self.input_pins}, method,
+                getattr(config, 'compression_max_interval', 3600))
         print(f'data will be saved to file: {self.db_file_path} \
             via : {self.db_url}')
 
@@ -84,6 +174,14 @@ class ArduinoSignalProcessor:
         INPUT = 0   # pin mode
         self.setup_analog(INPUT)
         self.setup_digital(INPUT)
+        # 'events': windows take the board's reports, see collect_reports
+        self.reports = None
+        events = getattr(config, 'sampling_mode', 'poll') == 'events'
+        if events and self.apins:
+            interval = getattr(config, 'firmata_sampling_interval', None)
+            if interval is not None:
+                self.set_firmata_interval(interval)
+            self.listen_reports()
 
     def setup_analog(self, pin_mode):
         board = self.board
@@ -123,23 +221,288 @@ class ArduinoSignalProcessor:
         gt = [(k, v) for k, v in self.analog_num_lookup.items() if k > a2d]
         self.analog_num = gt[0][1]
 
+    def set_sample_interval(self, a2d):
+        """
+        lookup of a2d:seconds between ticks, usually written by calibrate().
+        RETURNS : Nothing
+        SIDE-EFFECT: Sets sample_interval from 1st tuple in gt, if a lookup
+        was configured.
+        """
+        if self.sample_interval_lookup:
+            gt = [(k, v) for k, v in self.sample_interval_lookup.items()
+                  if k > a2d]
+            self.sample_interval = gt[0][1]
+
     def collect_inputs(self):
         """
         RETURNS: Nothing
         SIDE_EFFECT: current_state dict is updated with smoothed values.
-        Collects enough reads for each type of signal to do the smoothing.
+        Samples every configured pin on each tick of a single window, so one
+        refresh costs about one window instead of one window per pin.
+        Analogs feed each of the first analog_num reads through the pin's
+        streaming filter, which keeps its history between calls.
+        Digitals are read through each pin's Debouncer until they settle,
+        at most digital_read_budget reads or digital_time_budget secs; a pin
+        that is still bouncing keeps its last-known-good value, so the
+        window is always bounded.
         Sets the analog_num and db_interval, each by lookup functions(a2d)
+        With sampling_mode 'events', the window is collect_reports() instead.
+        """
+        if self.reports is not None:
+            return self.collect_reports()
+        window = self.begin_window()
+        for i in self.ticks(window['ticks']):
+            if not self.sample_tick(window, i):
+                break
+        self.end_window(window)
+
+    def begin_window(self):
+        """
+        RETURNS: a dict holding the readers and pending digitals of a window.
+        begin_window, sample_tick and end_window hold the sampling logic so
+        that any scheduler (ticks, an event loop) can drive it.
+        """
+        return {
+            'started': time.perf_counter(),
+            'analog_num': self.analog_num,
+            'ticks': max(self.analog_num, self.digital_read_budget),
+            'deadline': self.clock.monotonic() + self.digital_time_budget,
+            'areaders': [(p, self.get_reader('analog', p.pin, self.board))
+                         for p in self.apins],
+            # digitals still to be read this window
+            'pending': [(p, self.get_reader('digital', p.pin, self.board))
+                        for p in self.dpins],
+        }
+
+    def sample_tick(self, window, i):
+        """
+        Reads every pin of the window that still needs a read.
+        i is the tick index.
+        RETURNS: True while the window needs more ticks.
+        """
+        if i < window['analog_num']:
+            for apin, analog in window['areaders']:
+                t0 = time.perf_counter()
+                raw = analog.read()
+                READ_SECONDS.observe(time.perf_counter() - t0)
+                if self.capture is not None:
+                    self.capture.write(capture.ANALOG, apin.pin, raw)
+                apin.update(raw * 1023)
+        pending = window['pending']
+        if pending and self.clock.monotonic() < window['deadline']:
+            for dpin, digital in pending:
+                t0 = time.perf_counter()
+                raw = digital.read()
+                READ_SECONDS.observe(time.perf_counter() - t0)
+                if self.capture is not None:
+                    self.capture.write(capture.DIGITAL, dpin.pin, raw)
+                dpin.update(raw)
+            pending[:] = [(p, d) for p, d in pending if p.filter.bouncing]
+        else:
+            pending.clear()   # out of time: keep last-known-good values
+        return bool(pending) or i + 1 < window['analog_num']
+
+    def set_firmata_interval(self, ms):
+        """
+        SIDE_EFFECT: the board reports its analogs every ms millisecs
+        (Firmata SAMPLING_INTERVAL; the firmware default is 19).
+        """
+        self.board.send_sysex(SAMPLING_INTERVAL, [ms & 0x7F, ms >> 7 & 0x7F])
+
+    def listen_reports(self):
+        """
+        Wraps the board's handlers of the Firmata analog and digital
+        messages; they run on the util.Iterator thread. Each wrapper calls
+        pyfirmata's own handler, which sets the pin values, then queues
+        every report of a sampled pin, with its arrival time, as
+        (ns, capture.ANALOG or capture.DIGITAL, pin, raw) for
+        collect_reports().
+        """
+        self.reports = reports = queue.SimpleQueue()
+        clock = self.clock
+        board = self.board
+        ports = {}   # port: [sampled digital pin numbers]
+        for d in self.dpins:
+            ports.setdefault(d.pin // 8, []).append(d.pin)
+
+        def on_analog(pin_nr, lsb, msb):
+            raw = ((msb << 7) + lsb) / 1023
+            reports.put((clock.monotonic_ns(), capture.ANALOG, pin_nr, raw))
+
+        def on_digital(port_nr, lsb, msb):
+            mask = (msb << 7) + lsb
+            ns = clock.monotonic_ns()
+            for pin_nr in ports.get(port_nr, ()):
+                reports.put((ns, capture.DIGITAL, pin_nr,
+                             (mask >> pin_nr % 8) & 1))
+
+        def wrap(cmd, record):
+            # add_cmd_handler would count the bytes to read from the
+            # wrapper's arguments, so keep the original's count instead
+            original = board._command_handlers.get(cmd)
+
+            def handler(*data):
+                if original is not None:
+                    original(*data)
+                record(*data)
+            handler.bytes_needed = getattr(original, 'bytes_needed', 3)
+            board._command_handlers[cmd] = handler
+
+        wrap(ANALOG_MESSAGE, on_analog)
+        wrap(DIGITAL_MESSAGE, on_digital)
+
+    def collect_reports(self):
+        """
+        RETURNS: Nothing
+        SIDE_EFFECT: current_state dict is updated with smoothed values.
+        Event driven collect_inputs: every report the board sent since the
+        last window feeds its pin's filter, so no report is missed or read
+        twice, and the window waits on the report queue instead of
+        sleeping. Digital reports, sent by the board on every change, go
+        straight to the pin's Debouncer; a pin that starts bouncing is
+        pending again. Firmata reports a digital only when it changes, so
+        each report of the first analog pin is also a tick on which the
+        held level of the pending digitals is read, to let them settle,
+        within digital_read_budget and digital_time_budget as in
+        sample_tick(). The window ends once every analog had analog_num
+        reports and no digital is pending, or when a polled window would
+        have ended; reports queued by then are taken too.
+        """
+        window = self.begin_window()
+        apins = {p.pin: p for p in self.apins}
+        first = self.apins[0].pin
+        counts = dict.fromkeys(apins, 0)
+        pending = window['pending']
+        dpins = {p.pin: (p, d) for p, d in pending}
+        out_of_budget = False
+        ticks = 0
+        end = self.clock.monotonic() + max(
+            window['analog_num'] * self.sample_interval,
+            self.digital_time_budget)
+        while True:
+            waiting = pending or min(counts.values()) < window['analog_num']
+            try:
+                if waiting:
+                    remaining = end - self.clock.monotonic()
+                    if remaining <= 0:
+                        break
+                    ns, kind, pin, raw = self.reports.get(timeout=remaining)
+                else:
+                    ns, kind, pin, raw = self.reports.get_nowait()
+            except queue.Empty:
+                break
+            if kind == capture.DIGITAL:
+                entry = dpins.get(pin)
+                if entry is None:
+                    continue
+                if self.capture is not None:
+                    self.capture.write(capture.DIGITAL, pin, raw, ns)
+                entry[0].update(raw)
+                if entry[0].filter.bouncing:
+                    if not out_of_budget and entry not in pending:
+                        pending.append(entry)
+                elif entry in pending:
+                    pending.remove(entry)
+                continue
+            apin = apins.get(pin)
+            if apin is None:
+                continue
+            if self.capture is not None:
+                self.capture.write(capture.ANALOG, pin, raw, ns)
+            apin.update(raw * 1023)
+            counts[pin] += 1
+            if pin != first or not pending:
+                continue
+            ticks += 1
+            if ticks > self.digital_read_budget or \
+                    self.clock.monotonic() >= window['deadline']:
+                out_of_budget = True
+                pending.clear()   # out of budget: keep last-known-good values
+                continue
+            for dpin, digital in pending:
+                raw = digital.read()
+                if self.capture is not None:
+                    self.capture.write(capture.DIGITAL, dpin.pin, raw)
+                dpin.update(raw)
+            pending[:] = [(p, d) for p, d in pending if p.filter.bouncing]
+        self.end_window(window)
+
+    def end_window(self, window):
+        """
+        SIDE_EFFECT: copies the smoothed values of the window to
+        current_state and applies the a2d lookups.
         """
         for apin in self.apins:
-            a2d = self.smooth_analog(apin.pin)
+            a2d = round(apin.value)
             # sets values as functions of a2d
             self.set_analog_num(a2d)
             self.set_db_interval(a2d)
+            self.set_sample_interval(a2d)
+            self.track_noise(apin.name, a2d)
             self.current_state[apin.name] = a2d
+        for apin in self.apins:
+            if hasattr(apin.filter, 'resize'):
+                apin.filter.resize(self.analog_num)
 
         for dpin in self.dpins:
-            val = self.smooth_digital(dpin.pin)
-            self.current_state[dpin.name] = val
+            self.current_state[dpin.name] = dpin.value
+        WINDOW_SECONDS.observe(time.perf_counter() - window['started'])
+
+    def track_noise(self, name, a2d):
+        """
+        Adds the step from the pin's previous smoothed value to its Welford
+        stats. Steps of white noise have twice its variance and a slow drift
+        adds almost nothing, so the stats measure noise at any level.
+        Once warmed up, steps outside the envelope are real moves and are
+        kept out of the stats. The first value has no step.
+        """
+        prev = self.last_a2d.get(name)
+        self.last_a2d[name] = a2d
+        if prev is None:
+            return
+        step = a2d - prev
+        envelope = self.envelope(name)
+        if envelope is None or abs(step) <= 2 ** .5 * envelope:
+            self.noise_stats[name].update(step)
+
+    def noise(self, name):
+        """
+        RETURNS: the measured stddev of the pin's smoothed value in counts,
+        None until noise_min_samples steps were seen.
+        """
+        stats = self.noise_stats[name]
+        if stats.count < self.noise_min_samples:
+            return None
+        return stats.std / 2 ** .5
+
+    def envelope(self, name):
+        """
+        RETURNS: the measured 3-sigma envelope of the pin in counts, never
+        below analog_3sigma nor one A2D count; None while the noise is
+        still unknown. Without the count floor a sensor that was quiet
+        during warm up gets an envelope of 0, then every later step falls
+        outside it, so the stats never learn of the noise and every 1
+        count wiggle counts as a change.
+        """
+        sigma = self.noise(name)
+        if sigma is None:
+            return None
+        return max(self.analog_3sigma, 3 * sigma, A2D_QUANTUM)
+
+    def ticks(self, num=None):
+        """
+        Generator of tick indexes spaced sample_interval secs apart.
+        Deadlines are taken from the monotonic clock at the start of the
+        window, not from the previous tick, so sleep overshoot does not
+        accumulate into drift. num=None ticks forever.
+        """
+        interval = self.sample_interval
+        start = self.clock.monotonic()
+        for i in itertools.count() if num is None else range(num):
+            delay = start + i * interval - self.clock.monotonic()
+            if delay > 0:
+                self.clock.sleep(delay)
+            yield i
 
     def get_reader(self, type, pin, board):
         """
@@ -159,39 +522,131 @@ class ArduinoSignalProcessor:
         """
         _sum = 0
         analog = self.get_reader('analog', pin, self.board)
-        for i in range(self.analog_num):
-            _sum += analog.read()
-            time.sleep(.1)  # future study:find best sleep value for lowest noise.  # noqa: E501
+        for i in self.ticks(self.analog_num):
+            raw = analog.read()
+            if self.capture is not None:
+                self.capture.write(capture.ANALOG, pin, raw)
+            # future study:find best sleep value for lowest noise.
+            _sum += raw
         return round(_sum / self.analog_num * 1023)
 
     def smooth_digital(self, pin):
         """
         This method smooths for a single pin. pin is an int
         RETURNS: either [0|1] for the pin .Pins in range(2,14) are digital pins
-        Unexpected change in value (prev !=curr) below, resets the counters.
-        Winning counter is the one that exceeds num first.
-        Result is similar to debouncer of yester-year. CAUTION, If bit stream
-        alternates, so counters are constantly reset before num is reached,
-        an infinite loop could result.
+        Reads go through the pin's Debouncer, which keeps its state between
+        calls, until digital_num consecutive equal reads settle the pin.
+        Bounded by digital_read_budget reads and digital_time_budget secs:
+        if the bit stream keeps alternating, the last-known-good value is
+        returned and the pin's filter.bouncing stays True.
+        A pin with no Debouncer, eg not in input_names, is read once and the
+        read is passed through.
          """
-        falseCount = trueCount = 0
-        prev = curr = None
-        num = self.digital_num
+        dpin = next((p for p in self.dpins if p.pin == pin), None)
         digital = self.get_reader('digital', pin, self.board)
+        if dpin is None or dpin.filter is None:
+            raw = digital.read()
+            if self.capture is not None:
+                self.capture.write(capture.DIGITAL, pin, raw)
+            return raw if dpin is None else dpin.update(raw)
+        deadline = self.clock.monotonic() + self.digital_time_budget
 
-        while trueCount < num and falseCount < num:
-            curr = digital.read()
-            if curr == prev:
-                if curr == 1:
-                    trueCount += 1
-                else:
-                    falseCount += 1
-            else:  # start over when value changes, first read is wasted
-                falseCount = trueCount = 0
-            prev = curr  # for next read compare
-            time.sleep(.1)
+        for i in self.ticks(self.digital_read_budget):
+            raw = digital.read()
+            if self.capture is not None:
+                self.capture.write(capture.DIGITAL, pin, raw)
+            dpin.update(raw)
+            if not dpin.filter.bouncing or self.clock.monotonic() >= deadline:
+                break
+        return dpin.value
 
-        return int(trueCount > falseCount)
+    def bounce_counts(self):
+        """
+        RETURNS: dict of digital pin name: bounces seen since start, ie
+        levels that reverted before they settled.
+        """
+        return {p.name: p.filter.bounces for p in self.dpins}
+
+    def calibrate(self, spacings, counts, repeats=10, target_3sigma=2.0):
+        """
+        Calibration mode: finds the cheapest smoothing that is quiet enough.
+        For every spacing (secs between reads) and count (reads averaged),
+        takes repeats smoothed values of every analog pin, all pins read on
+        each tick, and measures the noise of the smoothed value (stddev and
+        its 3-sigma envelope, in A2D counts) against the secs it costs.
+        For each pin the cheapest setting whose 3-sigma envelope is within
+        target_3sigma is entered in the lookup bucket of the pin's level;
+        if none qualifies, the quietest setting is used.
+        RETURNS: dict with 'report' (one row per pin, spacing and count),
+        'analog_num_lookup' and 'sample_interval_lookup'. The lookups start
+        as copies of the current ones, so runs at different signal levels
+        can be merged; see format_lookups() to write them to config.py.
+        Raises ValueError for repeats < 2: the stddev needs two values.
+        """
+        if repeats < 2:
+            raise ValueError(
+                f'calibration needs repeats >= 2, got {repeats}')
+        report = []
+        saved = self.sample_interval
+        readers = [(p, self.get_reader('analog', p.pin, self.board))
+                   for p in self.apins]
+        try:
+            for spacing in spacings:
+                self.sample_interval = spacing
+                for num in counts:
+                    means = {p.name: [] for p in self.apins}
+                    for r in range(repeats):
+                        sums = dict.fromkeys(means, 0)
+                        for i in self.ticks(num):
+                            for apin, analog in readers:
+                                sums[apin.name] += analog.read()
+                        for name, _sum in sums.items():
+                            means[name].append(_sum / num * 1023)
+                    for name, m in means.items():
+                        stddev = statistics.stdev(m)
+                        report.append({'pin': name, 'spacing': spacing,
+                                       'count': num,
+                                       'level': statistics.mean(m),
+                                       'stddev': stddev, 'sigma3': 3 * stddev,
+                                       'secs': num * spacing})
+        finally:
+            self.sample_interval = saved
+
+        analog_num_lookup = dict(self.analog_num_lookup)
+        sample_interval_lookup = dict(
+            self.sample_interval_lookup or
+            {k: saved for k in self.analog_num_lookup})
+        chosen = {}
+        for apin in self.apins:
+            rows = [r for r in report if r['pin'] == apin.name]
+            level = statistics.mean(r['level'] for r in rows)
+            key = [k for k in analog_num_lookup if k > level][0]
+            quiet = [r for r in rows if r['sigma3'] <= target_3sigma]
+            if quiet:
+                best = min(quiet, key=lambda r: (r['secs'], r['count']))
+            else:
+                best = min(rows, key=lambda r: r['sigma3'])
+            # pins sharing a bucket get the more expensive of their settings
+            if key in chosen and chosen[key]['secs'] >= best['secs']:
+                continue
+            chosen[key] = best
+            analog_num_lookup[key] = best['count']
+            sample_interval_lookup[key] = best['spacing']
+
+        return {'report': report,
+                'analog_num_lookup': analog_num_lookup,
+                'sample_interval_lookup': sample_interval_lookup}
+
+    def format_lookups(self, calibration):
+        """
+        RETURNS: python source for the lookups of a calibrate() result,
+        ready to paste into config.py.
+        """
+        lines = []
+        for name in ('analog_num_lookup', 'sample_interval_lookup'):
+            lookup = dict(sorted(calibration[name].items()))
+            lines.append(f'{name} = {lookup}')
+        return '\n'.join(lines) + '\n'
 
     def changed(self, ts):
         """
@@ -202,17 +657,23 @@ class ArduinoSignalProcessor:
         and updates Former_state[pin] to equal current_state[pin]
         Options to limit db size due to unworthy measurements:
         1. time passed since last db_saved < db_interval     -> Used
-        2. analog changes less than 3 sigma considered noise -> Used
+        2. analog changes within the 3 sigma envelope are noise -> Used
         3. a2d values outside of limits are ignored,         -> Not Used.
-        Current usage: Only options 1,2 are applied but db_interval varies with
-        a2d value and analog_3sigma is set to 0. so currently, only timing
+        The envelope is measured per pin (see envelope()). Until enough
+        windows were seen to measure it, analog_3sigma is used alone, so
+        with analog_3sigma = 0 every interval is saved during warm up.
         """
         changed = 0
         #  timing
         if ts - self.db_saved > self.db_interval:
             for p in self.apins:
                 diff = self.current_state[p.name] - self.former_state[p.name]
-                if abs(diff) >= self.analog_3sigma:  # now set to zero
+                envelope = self.envelope(p.name)
+                if envelope is None:
+                    moved = abs(diff) >= self.analog_3sigma
+                else:
+                    moved = abs(diff) > envelope
+                if moved:
                     changed = True
                     self.former_state[p.name] = self.current_state[p.name]
 
@@ -221,29 +682,69 @@ class ArduinoSignalProcessor:
                     changed = True
                     self.former_state[p.name] = self.current_state[p.name]
 
+        CHANGE_CHECKS.inc()
+        if changed:
+            CHANGES.inc()
         return changed
 
-    def json_encode(self, datetimestamp):
+    def compress(self, datetimestamp):
+        """
+        Used instead of changed() when config.compression is set.
+        Feeds current_state to the compressor.
+        RETURNS: list of (datetime, state) records to save, oldest first;
+        usually empty, since only the points needed to rebuild each pin
+        within its compression_deviation are kept.
+        """
+        return self.compressor.add(datetimestamp, self.current_state)
+
+    def json_encode(self, datetimestamp, state=None):
         """
         RETURNS: json for the database save
         json will be like: {"A1": 997,"D2": false,...}. 
         It will reflect all input_names specified in the config
+        state defaults to current_state.
+        Values are filled into the serializer's template built in initialize().
         """
-        encoded = '{'
-        encoded += f'"ts":"{datetimestamp}",'
-        encoded += f'"src": "{self.src}",'
+        if state is None:
+            state = self.current_state
+        return self.serializer.json(datetimestamp, state)
 
-        for k, v in self.current_state.items():
-            val = int(v)
-            encoded += f'"{k}": {val},'
-        return encoded[:-1] + '}'
+    def encode(self, datetimestamp, state=None):
+        """
+        datetimestamp is a datetime.
+        RETURNS: (body, headers) for the post, in the configured wire_format
+        With storage_mode 'narrow', body is json of only the pins changed
+        since the last record encoded, None when no pin did.
+        """
+        if self.storage_mode == 'narrow':
+            if state is None:
+                state = self.current_state
+            return self.serializer.narrow_json(str(datetimestamp), state,
+                                               self.narrow_saved), {}
+        if self.wire_format == 'binary':
+            if state is None:
+                state = self.current_state
+            return (self.serializer.binary(datetimestamp, state),
+                    {'Content-Type': serializer.BINARY_MEDIA_TYPE})
+        return self.json_encode(str(datetimestamp), state), {}
 
-    def update_db(self, datetimestamp):
-        jd = self.json_encode(str(datetimestamp))
+    def update_db(self, datetimestamp, state=None):
+        """
+        RETURNS: the response of the post, or None when an uploader.Uploader
+        is attached: the record is then queued and posted by its thread.
+        Also None when encode gave no body.
+        """
+        body, headers = self.encode(datetimestamp, state)
         print()
-        print(f'sending to db: {jd}')
+        print(f'sending to db: {body}')
         # record the time of the db_save.
         self.db_saved = datetimestamp.timestamp()
-        # post the json to url
-        response = requests.post(self.db_url, data=jd)
+        if body is None:   # narrow: no pin changed, nothing to store
+            return None
+        if self.uploader is not None:
+            self.uploader.put(body, headers)
+            return None
+        # post the record to url
+        with POST_SECONDS.time():
+            response = requests.post(self.db_url, data=body, headers=headers)
         return response
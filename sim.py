@@ -0,0 +1,219 @@
+# file: sim.py
+
+import math
+import random
+from types import SimpleNamespace
+import numpy as np
+import capture
+import clock as clocks
+
+
+# Waveforms: functions of the monotonic time t in secs. Analog waveforms
+# give A2D counts, digital ones 0 or 1.
+
+def constant(value):
+    return lambda t: value
+
+
+def ramp(start, slope, low=0, high=1023):
+    """ start counts, rising slope counts per sec, held within low, high """
+    return lambda t: min(max(start + slope * t, low), high)
+
+
+def sine(level, amplitude, period):
+    return lambda t: level + amplitude * math.sin(2 * math.pi * t / period)
+
+
+def with_noise(wave, sigma, seed=None):
+    """ adds gaussian noise of sigma counts to wave """
+    rnd = random.Random(seed)
+    return lambda t: wave(t) + rnd.gauss(0, sigma)
+
+
+def square(period, duty=.5):
+    """ digital: 1 for the first duty of every period, else 0 """
+    return lambda t: int(t % period < duty * period)
+
+
+def bouncing_square(period, bounce_secs, seed=None):
+    """
+    digital square wave of 50% duty whose contacts bounce: reads within
+    bounce_secs after each edge are random.
+    """
+    rnd = random.Random(seed)
+    half = period / 2
+
+    def wave(t):
+        if t % half < bounce_secs:
+            return rnd.randint(0, 1)
+        return int(t % period < half)
+    return wave
+
+
+def replay(path, kind, pin, loop=False):
+    """
+    replays one pin of a capture.RawCapture file, held from each read to
+    the next, with the first read at t = 0. Analogs give counts.
+    With loop, the capture repeats; otherwise its last read is held.
+    """
+    ns, values = capture.pin_series(path, kind, pin)
+    if not len(ns):
+        raise ValueError(f'no reads of pin {pin} in {path}')
+    times = (ns - ns[0]) / 1e9
+    if kind == capture.ANALOG:
+        values = values * 1023
+    span = times[-1] + (times[-1] - times[0]) / max(len(times) - 1, 1)
+
+    def wave(t):
+        if loop and span:
+            t %= span
+        i = np.searchsorted(times, t, 'right') - 1
+        return float(values[max(i, 0)])
+    return wave
+
+
+class SimPin:
+    """ stands in for a pyfirmata Pin: read() follows the pin's waveform """
+
+    def __init__(self, kind, clock, wave=None):
+        self.kind = kind
+        self.clock = clock
+        self.wave = wave
+        self.mode = 0
+        self.value = 0
+        self.reporting = False
+
+    def _get_mode(self):
+        return self.mode
+
+    def enable_reporting(self):
+        self.reporting = True
+
+    def disable_reporting(self):
+        self.reporting = False
+
+    def read(self):
+        """ analogs as pyfirmata reports them: a fraction 0..1 of 4 places """
+        if self.wave is None:
+            return self.value
+        value = self.wave(self.clock.monotonic())
+        if self.kind == capture.ANALOG:
+            return round(min(max(value, 0), 1023) / 1023, 4)
+        return int(bool(value))
+
+
+class SimArduino:
+    """
+    Simulated board in place of pyfirmata.Arduino. waves is a dict of pin
+    name ("A0", "D2", ...): waveform; pins without one read their value.
+    """
+
+    def __init__(self, port, clock=clocks.system, waves=None):
+        self.port = port
+        waves = waves or {}
+        self.analog = [SimPin(capture.ANALOG, clock, waves.get(f'A{i}'))
+                       for i in range(6)]
+        self.digital = [SimPin(capture.DIGITAL, clock, waves.get(f'D{i}'))
+                        for i in range(14)]
+        self.sysex = []
+        self._command_handlers = {}   # as pyfirmata's, see listen_reports
+
+    def send_sysex(self, sysex_cmd, data):
+        self.sysex.append((sysex_cmd, data))
+
+    def exit(self):
+        pass
+
+
+class SimIterator:
+    """ in place of pyfirmata.util.Iterator: simulated pins need no thread """
+
+    def __init__(self, board):
+        self.board = board
+        self.started = False
+
+    def start(self):
+        self.started = True
+
+    def is_alive(self):
+        return self.started
+
+
+class Simulator:
+    """
+    Arduino and util for ArduinoSignalProcessor.initialize, reading waves
+    on clock, eg:
+        sim = Simulator({'A1': with_noise(ramp(300, .1), 2)}, VirtualClock())
+        proc.clock = sim.clock
+        proc.initialize(config, sim.Arduino, sim.util, sim.clock.time())
+    """
+
+    def __init__(self, waves, clock=None):
+        self.waves = waves
+        self.clock = clock or clocks.VirtualClock()
+        self.util = SimpleNamespace(Iterator=SimIterator)
+
+    def Arduino(self, port):
+        return SimArduino(port, self.clock, self.waves)
+
+
+class RecordingUploader:
+    """ in place of uploader.Uploader: keeps every record put """
+
+    def __init__(self):
+        self.records = []
+
+    def put(self, body, headers=None):
+        self.records.append(body)
+
+    def stats(self):
+        return {'queue_depth': 0, 'sent': len(self.records)}
+
+
+def run(proc, windows):
+    """
+    runs windows sampling windows of an initialized proc as the sampler
+    does: collect_inputs, then compress or changed, then update_db, all
+    timed by proc.clock.
+    RETURNS: the records saved, as encoded for the db.
+    """
+    saved = proc.uploader = RecordingUploader()
+    for _ in range(windows):
+        proc.collect_inputs()
+        dts = proc.clock.now()
+        if proc.compressor is not None:
+            records = proc.compress(dts)
+        elif proc.changed(dts.timestamp()):
+            records = [(dts, None)]
+        else:
+            records = []
+        for rdts, state in records:
+            proc.update_db(rdts, state)
+    return saved.records
+
+
+if __name__ == '__main__':
+    import sys
+    import time
+    import contextlib
+    import io
+    import config
+    import signal_processor
+    hours = float(sys.argv[1]) if len(sys.argv) > 1 else 24
+    sim = Simulator({'A0': with_noise(sine(500, 200, 3600), 2, seed=1),
+                     'A1': with_noise(ramp(100, .01), 2, seed=2),
+                     'D2': bouncing_square(600, .05, seed=3),
+                     'D3': square(3600)})
+    proc = signal_processor.ArduinoSignalProcessor()
+    proc.clock = sim.clock
+    t0 = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        proc.initialize(config, sim.Arduino, sim.util, sim.clock.time())
+        records, windows = [], 0
+        while sim.clock.monotonic() < hours * 3600:
+            records += run(proc, 100)
+            windows += 100
+    secs = time.perf_counter() - t0
+    print(f'{hours} simulated hours, {windows} windows, {len(records)} '
+          f'records in {secs:.1f} secs: '
+          f'{hours * 3600 / secs:.0f}x real time')
@@ -0,0 +1,197 @@
+# file: spool.py
+
+import os
+import time
+import zlib
+import struct
+import threading
+
+# frame: seq u64, wall time f64, kind u8, payload length u32, payload,
+# then crc32 u32 of header and payload, to find a torn write at recovery
+FRAME = struct.Struct('<QdBI')
+CRC = struct.Struct('<I')
+JSON, BINARY = 0, 1
+BINARY_HEADERS = {'Content-Type': 'application/octet-stream'}
+
+
+class Spool:
+    """
+    Durable store-and-forward log of encoded records, written before upload.
+    Records are appended to segment files named by their first seq and
+    rotated at segment_bytes. Appends are flushed to the OS at once but
+    fsync'ed in batches, every fsync_every records or fsync_secs secs.
+    The uploader read()s the oldest records not yet acknowledged and
+    ack()s them once the server has them; the ack seq is kept in the file
+    'ack', and segments holding only acked records are deleted.
+    Opening a spool recovers after a crash: a torn frame at the end of the
+    last segment is cut off and reading resumes after the ack.
+    Safe for one writer and one reader thread.
+    """
+
+    def __init__(self, directory, segment_bytes=1 << 20, fsync_every=20,
+                 fsync_secs=1.0):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.fsync_every = fsync_every
+        self.fsync_secs = fsync_secs
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self.acked = self.read_ack()
+        self.segments = sorted(int(f.split('.')[0])
+                               for f in os.listdir(directory)
+                               if f.endswith('.spool'))
+        self.next_seq = self.acked + 1
+        if self.segments:
+            self.next_seq = max(self.next_seq, self.recover(self.segments[-1]))
+        self.writer = None
+        self.unsynced = 0
+        self.synced_at = time.monotonic()
+        # read cursor: (segment, offset) before which every record is acked
+        self.cursor = None
+
+    def path(self, first_seq):
+        return os.path.join(self.directory, f'{first_seq:016d}.spool')
+
+    def read_ack(self):
+        try:
+            with open(os.path.join(self.directory, 'ack')) as f:
+                return int(f.read() or 0)
+        except FileNotFoundError:
+            return 0
+
+    def frames(self, f):
+        """ generator of (offset, seq, wall, kind, payload) of valid frames """
+        while True:
+            offset = f.tell()
+            header = f.read(FRAME.size)
+            if len(header) < FRAME.size:
+                return
+            seq, wall, kind, length = FRAME.unpack(header)
+            payload = f.read(length)
+            crc = f.read(CRC.size)
+            if len(payload) < length or len(crc) < CRC.size or \
+                    CRC.unpack(crc)[0] != zlib.crc32(header + payload):
+                f.seek(offset)
+                return
+            yield offset, seq, wall, kind, payload
+
+    def recover(self, first_seq):
+        """
+        cuts a torn frame off the end of the segment.
+        RETURNS: the seq after the last valid frame.
+        """
+        next_seq = first_seq
+        with open(self.path(first_seq), 'r+b') as f:
+            for _, seq, _, _, _ in self.frames(f):
+                next_seq = seq + 1
+            if f.tell() < os.fstat(f.fileno()).st_size:
+                print(f'spool: cut torn record after seq {next_seq - 1}')
+                f.truncate(f.tell())
+        return next_seq
+
+    def append(self, body, headers=None):
+        """
+        writes one encoded record (see ArduinoSignalProcessor.encode).
+        RETURNS: its seq.
+        """
+        kind = BINARY if isinstance(body, bytes) else JSON
+        payload = body if kind == BINARY else body.encode()
+        with self.lock:
+            if self.writer is None or self.writer.tell() >= self.segment_bytes:
+                self.rotate()
+            seq = self.next_seq
+            header = FRAME.pack(seq, time.time(), kind, len(payload))
+            self.writer.write(header + payload +
+                              CRC.pack(zlib.crc32(header + payload)))
+            self.writer.flush()
+            self.next_seq += 1
+            self.unsynced += 1
+            if self.unsynced >= self.fsync_every:
+                self.sync_locked()
+        return seq
+
+    def rotate(self):
+        if self.writer is not None:
+            self.sync_locked()
+            self.writer.close()
+        if not self.segments or self.segments[-1] != self.next_seq:
+            self.segments.append(self.next_seq)
+        self.writer = open(self.path(self.next_seq), 'ab')
+
+    def sync(self, due_only=False):
+        """
+        fsyncs appended records; with due_only, only when fsync_secs passed
+        """
+        with self.lock:
+            if self.unsynced and (not due_only or time.monotonic() -
+                                  self.synced_at >= self.fsync_secs):
+                self.sync_locked()
+
+    def sync_locked(self):
+        if self.writer is not None:
+            self.writer.flush()
+            os.fsync(self.writer.fileno())
+        self.unsynced = 0
+        self.synced_at = time.monotonic()
+
+    def read(self, num):
+        """
+        RETURNS: up to num of the oldest unacked records as a list of
+        (seq, wall time, body, headers). Does not consume them: the same
+        records are returned until they are ack()ed.
+        """
+        with self.lock:
+            segments = list(self.segments)
+        if not segments:
+            return []
+        records = []
+        start, start_offset = self.cursor or (segments[0], 0)
+        for first in [s for s in segments if s >= start]:
+            try:
+                f = open(self.path(first), 'rb')
+            except FileNotFoundError:   # deleted by ack meanwhile
+                continue
+            with f:
+                f.seek(start_offset if first == start else 0)
+                for _, seq, wall, kind, payload in self.frames(f):
+                    if seq <= self.acked:
+                        # skip acked records for good, while none is unacked
+                        if not records:
+                            self.cursor = (first, f.tell())
+                        continue
+                    body = payload if kind == BINARY else payload.decode()
+                    headers = BINARY_HEADERS if kind == BINARY else {}
+                    records.append((seq, wall, body, headers))
+                    if len(records) == num:
+                        return records
+        return records
+
+    def ack(self, seq):
+        """
+        acknowledges every record up to seq, persists it and deletes the
+        segments that hold only acknowledged records.
+        """
+        self.acked = seq
+        tmp = os.path.join(self.directory, 'ack.tmp')
+        with open(tmp, 'w') as f:
+            f.write(str(seq))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, os.path.join(self.directory, 'ack'))
+        with self.lock:
+            while len(self.segments) > 1 and self.segments[1] <= seq + 1:
+                first = self.segments.pop(0)
+                os.remove(self.path(first))
+                if self.cursor is not None and self.cursor[0] == first:
+                    self.cursor = None
+
+    def pending(self):
+        """ RETURNS: number of records appended but not acknowledged """
+        return self.next_seq - 1 - self.acked
+
+    def close(self):
+        with self.lock:
+            if self.writer is not None:
+                self.sync_locked()
+                self.writer.close()
+                self.writer = None
@@ -0,0 +1,57 @@
+# file: cache.py
+
+import hashlib
+from collections import OrderedDict
+
+
+class ResponseCache:
+    """
+    LRU of encoded GET responses by ETag: at most max_entries of them and
+    max_bytes of bodies in all. A body larger than max_bytes is not kept.
+    Used from the event loop only, so it takes no lock.
+    """
+
+    def __init__(self, max_entries=32, max_bytes=64 << 20):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()   # etag: (body, media_type, headers)
+        self.bytes = 0
+
+    def get(self, etag):
+        """ RETURNS: (body, media_type, headers) cached for etag, or None """
+        entry = self.entries.get(etag)
+        if entry is not None:
+            self.entries.move_to_end(etag)
+        return entry
+
+    def put(self, etag, body, media_type, headers):
+        if len(body) > self.max_bytes or etag in self.entries:
+            return
+        self.entries[etag] = (body, media_type, headers)
+        self.bytes += len(body)
+        while (len(self.entries) > self.max_entries
+               or self.bytes > self.max_bytes):
+            _, (old, _, _) = self.entries.popitem(last=False)
+            self.bytes -= len(old)
+
+    def clear(self):
+        self.entries.clear()
+        self.bytes = 0
+
+
+def make_etag(version, path, query_params):
+    """
+    RETURNS: a strong ETag of the data version, eg max(id) of the table,
+    and the request: path and query params in any order.
+    """
+    request = repr((path, sorted(query_params.multi_items())))
+    digest = hashlib.blake2b(request.encode(), digest_size=8).hexdigest()
+    return f'"{version}-{digest}"'
+
+
+def etag_matches(if_none_match, etag):
+    """ RETURNS: True when an If-None-Match header value lists etag """
+    if not if_none_match:
+        return False
+    tags = [t.strip() for t in if_none_match.split(",")]
+    return "*" in tags or any(t.removeprefix("W/") == etag for t in tags)
@@ -0,0 +1,94 @@
+# file: storage.py
+
+import asyncio
+import databases
+import sqlalchemy
+from databases.backends.sqlite import SQLiteBackend, SQLitePool
+from sqlalchemy.dialects.sqlite import pysqlite
+
+# the dialect the sqlite backend compiles with, for statements sent to the
+# driver directly
+DIALECT = pysqlite.dialect(paramstyle="qmark")
+
+
+class TunedSQLitePool(SQLitePool):
+    """
+    The sqlite pool of databases opens a new connection on every acquire.
+    This one keeps released connections open for reuse, at most
+    max_size of them in use at once (acquire waits for one beyond that),
+    and runs pragmas, eg config.sqlite_pragmas, once on each new connection.
+    SQLitePool is internal to databases: requirements.txt pins the
+    databases version this is written against.
+    """
+
+    def __init__(self, url, max_size=4, pragmas=None, **options):
+        super().__init__(url, **options)
+        self.max_size = max_size
+        self.pragmas = pragmas or {}
+        self.idle = []
+        self.slots = None   # made in the running loop on first acquire
+
+    async def acquire(self):
+        if self.slots is None:
+            self.slots = asyncio.Semaphore(self.max_size)
+        await self.slots.acquire()
+        try:
+            if self.idle:
+                return self.idle.pop()
+            connection = await super().acquire()
+            for name, value in self.pragmas.items():
+                await connection.execute(f"PRAGMA {name}={value}")
+            return connection
+        except BaseException:
+            self.slots.release()
+            raise
+
+    async def release(self, connection):
+        self.slots.release()
+        if connection.in_transaction:   # left over by an error: drop it
+            await super().release(connection)
+        else:
+            self.idle.append(connection)
+
+    async def close(self):
+        while self.idle:
+            await super().release(self.idle.pop())
+        self.slots = None
+
+
+class TunedSQLiteBackend(SQLiteBackend):
+    """ SQLiteBackend on a TunedSQLitePool, see Database """
+
+    def __init__(self, database_url, max_size=4, pragmas=None, **options):
+        super().__init__(database_url, **options)
+        self._pool = TunedSQLitePool(self._database_url, max_size, pragmas,
+                                     **options)
+
+    async def disconnect(self):
+        await self._pool.close()
+        await super().disconnect()
+
+
+class Database(databases.Database):
+    """
+    databases.Database whose sqlite connections are pooled and tuned,
+    eg Database(url, max_size=4, pragmas=config.sqlite_pragmas). Other
+    backends as usual.
+    """
+
+    SUPPORTED_BACKENDS = {**databases.Database.SUPPORTED_BACKENDS,
+                          "sqlite": "storage:TunedSQLiteBackend"}
+
+
+async def create_schema(database, metadata):
+    """
+    creates the tables and indexes of metadata that do not exist yet,
+    once at startup. The DDL is compiled here: databases compiles with
+    options the sqlite CREATE INDEX compiler does not take.
+    """
+    for table in metadata.sorted_tables:
+        ddl = [sqlalchemy.schema.CreateTable(table, if_not_exists=True)]
+        ddl += [sqlalchemy.schema.CreateIndex(index, if_not_exists=True)
+                for index in table.indexes]
+        for statement in ddl:
+            await database.execute(str(statement.compile(dialect=DIALECT)))
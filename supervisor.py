@@ -0,0 +1,180 @@
+# file: supervisor.py
+
+import time
+import datetime
+import threading
+from types import MappingProxyType, SimpleNamespace
+import signal_processor as p
+
+
+def board_config(config, overrides):
+    """
+    RETURNS: a config namespace holding every setting of the config module,
+    with the settings of one entry of config.boards (usb_port, src,
+    input_names, ...) replacing them.
+    """
+    settings = {k: v for k, v in vars(config).items()
+                if not k.startswith('_')}
+    return SimpleNamespace(**{**settings, **overrides})
+
+
+class Board:
+    """
+    One Arduino of the supervisor: its own ArduinoSignalProcessor, so its
+    own serial port and util.Iterator reader thread, sampled by its own
+    thread. An error stops only this board, which is reopened after
+    retry_secs; the other boards keep sampling.
+    """
+
+    def __init__(self, config, Arduino, util, uploader, processor_class,
+                 retry_secs=10):
+        self.config = config
+        self.src = config.src
+        self.Arduino = Arduino
+        self.util = util
+        self.uploader = uploader
+        self.proc = processor_class()
+        self.retry_secs = retry_secs
+        self.snapshot = None
+        self.thread = None
+        self.initialized = False
+        self.opened = None   # the Arduino open on the port, if any
+        self.windows = self.saved = self.errors = 0
+        self.last_window_secs = 0.0
+        self.last_error = None
+
+    def run(self, stopping):
+        while not stopping.is_set():
+            try:
+                if not self.initialized:
+                    self.proc.initialize(self.config, self.open, self.util,
+                                         time.time())
+                    self.proc.uploader = self.uploader
+                    self.initialized = True
+                self.sample()
+            except Exception as e:   # keep the other boards running
+                self.errors += 1
+                self.last_error = repr(e)
+                print(f'board {self.src}: {e!r}, reopening in '
+                      f'{self.retry_secs} secs')
+                self.close()
+                stopping.wait(self.retry_secs)
+        if self.initialized and self.proc.compressor is not None:
+            for dts, state in self.proc.compressor.flush():
+                self.proc.update_db(dts, state)
+        self.close()
+
+    def open(self, port):
+        """
+        RETURNS: the Arduino on port, passed to initialize in its place so
+        the board is known to be open even when initialize then raises.
+        """
+        self.opened = self.Arduino(port)
+        return self.opened
+
+    def close(self):
+        """
+        closes the serial port, so its iterator thread ends, and the
+        capture so a reopen starts clean; an opened board is closed even
+        when initialize failed after opening it.
+        """
+        self.initialized = False
+        if getattr(self.proc, 'capture', None) is not None:
+            self.proc.capture.close()
+            self.proc.capture = None
+        if self.opened is not None:
+            board, self.opened = self.opened, None
+            try:
+                board.exit()
+            except Exception as e:
+                print(f'board {self.src}: close failed: {e!r}')
+
+    def sample(self):
+        """ one window, then the records it produced go to the uploader """
+        t0 = time.monotonic()
+        proc = self.proc
+        proc.collect_inputs()
+        dts = datetime.datetime.now()
+        if proc.compressor is not None:
+            records = proc.compress(dts)
+        elif proc.changed(dts.timestamp()):
+            records = [(dts, None)]
+        else:
+            records = []
+        for rdts, state in records:
+            proc.update_db(rdts, state)
+        self.saved += len(records)
+        self.windows += 1
+        self.last_window_secs = time.monotonic() - t0
+        self.snapshot = MappingProxyType(
+            {**proc.current_state, "src": self.src, "ts": str(dts)})
+
+    def stats(self):
+        return {'windows': self.windows, 'saved': self.saved,
+                'errors': self.errors, 'last_error': self.last_error,
+                'last_window_secs': self.last_window_secs}
+
+
+class BoardSupervisor:
+    """
+    Samples many Arduinos from one process. boards is a list of dicts, each
+    overriding the config module for one board (see board_config); each
+    board runs on its own thread, so boards sample concurrently and a slow
+    or failing board never stalls the others. All boards share one
+    uploader.Uploader, and status() is their one metrics surface.
+    """
+
+    def __init__(self, config, boards, Arduino, util, uploader,
+                 processor_class=p.ArduinoSignalProcessor, retry_secs=10):
+        self.uploader = uploader
+        self.boards = [Board(board_config(config, b), Arduino, util,
+                             uploader, processor_class, retry_secs)
+                       for b in boards]
+        srcs = [b.src for b in self.boards]
+        if len(set(srcs)) != len(srcs):
+            raise ValueError(f'every board needs its own src: {srcs}')
+        self.stopping = threading.Event()
+
+    def start(self):
+        self.stopping.clear()
+        for board in self.boards:
+            board.thread = threading.Thread(
+                target=board.run, args=(self.stopping,),
+                name=f'board-{board.src}', daemon=True)
+            board.thread.start()
+
+    def stop(self, timeout=None):
+        """ lets every board finish its window, then flushes the uploads """
+        self.stopping.set()
+        for board in self.boards:
+            if board.thread is not None:
+                board.thread.join(timeout)
+        self.uploader.stop(timeout)
+
+    def get_data(self):
+        """
+        RETURNS: dict of src: latest read-only record of that board, None
+        for a board that has not completed a window yet. Never blocks.
+        """
+        return {b.src: b.snapshot for b in self.boards}
+
+    def status(self):
+        """ RETURNS: per-board sampling stats and the shared uploader's """
+        return {'boards': {b.src: b.stats() for b in self.boards},
+                'uploader': self.uploader.stats()}
+
+
+if __name__ == '__main__':
+    import config
+    import sampler
+    from pyfirmata import Arduino, util
+    supervisor = BoardSupervisor(config, config.boards, Arduino, util,
+                                 sampler.initialize_uploader(),
+                                 retry_secs=config.board_retry_secs)
+    supervisor.start()
+    try:
+        while True:
+            time.sleep(60)
+            print(supervisor.status())
+    except KeyboardInterrupt:
+        supervisor.stop()
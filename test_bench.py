@@ -0,0 +1,37 @@
+# test_bench.py
+
+import json
+import bench
+
+
+def test_compare_flags_slowdowns():
+    baseline = {'results': {'a[10]': {'best': 1.0}, 'b[10]': {'best': 1.0}}}
+    current = {'results': {'a[10]': {'best': 1.3}, 'b[10]': {'best': 1.1},
+                           'c[10]': {'best': 9.0}}}
+    assert bench.compare(baseline, current) == [('a[10]', 1.0, 1.3)]
+    assert bench.compare(baseline, current, threshold=1.5) == []
+
+
+def test_smooth_digital_takes_the_whole_budget():
+    proc = bench.sim_proc(['D3'])
+    proc.digital_read_budget = 50
+    proc.digital_time_budget = float('inf')
+    proc.smooth_digital(3)
+    assert proc.dpins[0].filter.bouncing
+    # every read after the first reverts an unsettled level
+    assert proc.bounce_counts()['D3'] == 49
+
+
+def test_save_and_compare_baseline(tmp_path):
+    path = str(tmp_path / 'baseline.json')
+    args = ['changed', 'every_nth', '--max-size', '10', '--repeat', '1']
+    assert bench.main(args + ['--save', path]) == 0
+    with open(path) as f:
+        baseline = json.load(f)
+    assert set(baseline['results']) == {'changed[3]', 'every_nth[10]'}
+
+    for result in baseline['results'].values():
+        result['best'] /= 100   # pretend the baseline was much faster
+    with open(path, 'w') as f:
+        json.dump(baseline, f)
+    assert bench.main(args + ['--compare', path]) == 1
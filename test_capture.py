@@ -0,0 +1,49 @@
+# test_capture.py
+
+import numpy as np
+import capture
+
+
+def test_write_and_read(tmp_path):
+    path = str(tmp_path / 'capture.bin')
+    cap = capture.RawCapture(path, capacity=8)
+    cap.write(capture.ANALOG, 1, .5)
+    cap.write(capture.DIGITAL, 2, True)
+    cap.write(capture.ANALOG, 1, .25)
+
+    [records] = capture.read_capture(path)
+    assert list(records['kind']) == [0, 1, 0]
+    assert list(records['pin']) == [1, 2, 1]
+    assert list(records['value']) == [.5, 1.0, .25]
+    assert np.all(np.diff(records['ns']) >= 0)
+    # a view of the mapped file, not a copy
+    assert not records.flags.owndata and not records.flags.writeable
+
+    ns, values = capture.pin_series(path, capture.ANALOG, 1)
+    assert list(values) == [.5, .25] and len(ns) == 2
+    cap.close()
+
+
+def test_ring_wraps_oldest_first(tmp_path):
+    path = str(tmp_path / 'capture.bin')
+    cap = capture.RawCapture(path, capacity=4)
+    for i in range(6):
+        cap.write(capture.ANALOG, 0, i)
+
+    parts = capture.read_capture(path)
+    assert [list(p['value']) for p in parts] == [[2, 3], [4, 5]]
+    cap.close()
+
+
+def test_reopen_appends(tmp_path):
+    path = str(tmp_path / 'capture.bin')
+    cap = capture.RawCapture(path, capacity=4)
+    cap.write(capture.ANALOG, 0, 1)
+    cap.close()
+    cap = capture.RawCapture(path, capacity=4)
+    cap.write(capture.ANALOG, 0, 2)
+    cap.close()
+    assert list(np.concatenate(capture.read_capture(path))['value']) == [1, 2]
+    # another capacity starts a new capture
+    capture.RawCapture(path, capacity=2).close()
+    assert len(capture.read_capture(path)[0]) == 0
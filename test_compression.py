@@ -0,0 +1,89 @@
+# test_compression.py
+
+import datetime
+import math
+import random
+import pytest
+import numpy as np
+import compression
+
+t0 = datetime.datetime(2021, 1, 1, 0, 0, 0)
+
+
+def run(compressor, values, step=1):
+    """ feeds (A1, D2) pairs one step secs apart, RETURNS archived records """
+    kept = []
+    for i, (a1, d2) in enumerate(values):
+        dts = t0 + datetime.timedelta(seconds=i * step)
+        kept += compressor.add(dts, {'A1': a1, 'D2': d2})
+    return kept + compressor.flush()
+
+
+def test_swinging_door_keeps_ramp_ends():
+    c = compression.RecordCompressor({'A1': 2, 'D2': 0})
+    kept = run(c, [(100 + 3 * i, 0) for i in range(50)])
+
+    assert [s['A1'] for _, s in kept] == [100, 247]
+    assert c.report()['ratio'] == 25
+    assert c.report()['max_error']['A1'] == 0
+
+
+def test_swinging_door_archives_corner_and_digital_flip():
+    c = compression.RecordCompressor({'A1': 2, 'D2': 0})
+    values = [(100 + 3 * i, 0) for i in range(20)]
+    values += [(157, 0)] * 10 + [(157, 1)] * 10
+    kept = run(c, values)
+
+    assert [(s['A1'], s['D2']) for _, s in kept] == [
+        (100, 0), (157, 0), (157, 0), (157, 1), (157, 1)]
+    # the slope to 20s is outside the door of the ramp: the corner at 19s
+    # is archived, so the line never leaves the deviation
+    assert kept[1][0] == t0 + datetime.timedelta(seconds=19)
+    assert c.report()['max_error']['A1'] == 0
+
+
+def test_swinging_door_error_is_measured_on_noise():
+    rnd = random.Random(2)
+    c = compression.RecordCompressor({'A1': 4, 'D2': 0})
+    kept = run(c, [(round(500 + rnd.gauss(0, 1.5)), 1) for i in range(500)])
+
+    report = c.report()
+    assert report['ratio'] > 5
+    assert report['received'] == 500 and report['archived'] == len(kept)
+    assert report['max_error']['A1'] <= 4
+
+
+def test_swinging_door_reconstructs_within_deviation():
+    rnd = random.Random(3)
+    values = [(200 + 80 * math.sin(i / 15) + rnd.gauss(0, 1), 0)
+              for i in range(1000)]
+    c = compression.RecordCompressor({'A1': 2.5, 'D2': 0})
+    kept = run(c, values)
+
+    t = [(dts - t0).total_seconds() for dts, _ in kept]
+    rebuilt = np.interp(range(len(values)), t, [s['A1'] for _, s in kept])
+    error = np.abs(rebuilt - [a1 for a1, _ in values])
+    assert len(kept) < len(values) / 4
+    assert error.max() <= 2.5 + 1e-9
+    assert c.report()['max_error']['A1'] == pytest.approx(error.max())
+
+
+def test_deadband():
+    c = compression.RecordCompressor({'A1': 5, 'D2': 0}, 'deadband')
+    kept = run(c, [(a, 0) for a in [100, 103, 105, 106, 104, 99, 112]])
+
+    assert [s['A1'] for _, s in kept] == [100, 106, 99, 112]
+    assert c.report()['max_error']['A1'] == 5
+
+
+def test_max_interval():
+    c = compression.RecordCompressor({'A1': 2, 'D2': 0}, max_interval=10)
+    kept = run(c, [(100, 0)] * 25)
+
+    assert [int((dts - t0).total_seconds()) for dts, _ in kept] == [
+        0, 10, 20, 24]
+
+
+def test_unknown_method():
+    with pytest.raises(ValueError):
+        compression.RecordCompressor({'A1': 2}, 'boxcar')
@@ -0,0 +1,82 @@
+# test_filters.py
+
+import random
+import statistics
+import pytest
+import filters
+
+
+def test_rolling_mean_window():
+    f = filters.RollingMean(3)
+    assert [f.update(x) for x in [3, 6, 9, 12]] == [3, 4.5, 6, 9]
+
+
+def test_rolling_mean_resize_keeps_newest():
+    f = filters.RollingMean(4)
+    for x in [1, 2, 3, 4, 5]:
+        f.update(x)
+    f.resize(2)
+    assert f.count == 2 and f.value == 4.5
+    assert f.update(7) == 6
+
+
+def test_ema():
+    f = filters.EMA(.5)
+    assert [f.update(x) for x in [10, 20, 20]] == [10, 15, 17.5]
+
+
+def test_running_median_matches_statistics():
+    random.seed(7)
+    f = filters.RunningMedian(9)
+    window = []
+    for _ in range(500):
+        x = random.randint(0, 1023)
+        window = (window + [x])[-9:]
+        assert f.update(x) == statistics.median_low(window)
+
+
+def test_running_median_clamps_to_levels():
+    f = filters.RunningMedian(3)
+    assert f.update(-5) == 0
+    assert f.update(5000) == 0
+    assert f.update(5000) == 1023
+
+
+def test_kalman_converges_on_level():
+    random.seed(3)
+    f = filters.Kalman(.01, 4.0)
+    for _ in range(300):
+        f.update(300 + random.gauss(0, 2))
+    assert abs(f.value - 300) < 1
+
+
+def test_make_filter():
+    assert isinstance(filters.make_filter('median', 5), filters.RunningMedian)
+    with pytest.raises(ValueError):
+        filters.make_filter('fir', 5)
+
+
+def test_debouncer_settles_after_num_reads():
+    f = filters.Debouncer(3)
+    assert [f.update(b) for b in [1, 1, 1, 1]] == [0, 0, 1, 1]
+    assert not f.bouncing and f.bounces == 0   # a clean change
+
+
+def test_debouncer_keeps_last_known_good_while_bouncing():
+    f = filters.Debouncer(3, 1)
+    for b in [0, 1, 0, 1, 0]:
+        assert f.update(b) == 1
+    # the first 0 is a change, each read after it reverts an unsettled one
+    assert f.bouncing and f.bounces == 4
+    assert [f.update(b) for b in [0, 0, 1, 1, 1]] == [1, 0, 0, 0, 1]
+    assert f.bounces == 4   # 0 settled, so the change to 1 is clean
+
+
+def test_running_stats_matches_statistics():
+    random.seed(11)
+    data = [random.gauss(500, 7) for _ in range(1000)]
+    f = filters.RunningStats()
+    for x in data:
+        f.update(x)
+    assert f.mean == pytest.approx(statistics.mean(data))
+    assert f.std == pytest.approx(statistics.stdev(data))
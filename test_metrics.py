@@ -0,0 +1,41 @@
+# test_metrics.py
+
+import json
+import metrics
+
+
+def test_histogram_buckets_and_quantiles():
+    h = metrics.Histogram('t_seconds', 'test', buckets=(.1, 1))
+    for v in (.05, .1, .5, 2):
+        h.observe(v)
+    assert h.counts == [2, 1, 1]
+    assert h.count == 4 and h.sum == 2.65
+    assert h.quantile(.5) == .1 and h.quantile(.75) == 1
+    assert h.quantile(1) is None   # above the last bucket
+    with h.time():
+        pass
+    assert h.count == 5
+
+
+def test_registry_shares_and_renders():
+    r = metrics.Registry()
+    c = r.counter('x_total', 'xs')
+    assert r.counter('x_total', 'xs') is c
+    c.inc(2)
+    r.histogram('y_seconds', 'ys', buckets=(1,)).observe(.5)
+    assert r.render().splitlines() == [
+        '# HELP x_total xs', '# TYPE x_total counter', 'x_total 2',
+        '# HELP y_seconds ys', '# TYPE y_seconds histogram',
+        'y_seconds_bucket{le="1"} 1', 'y_seconds_bucket{le="+Inf"} 1',
+        'y_seconds_sum 0.5', 'y_seconds_count 1']
+
+
+def test_write_status(tmp_path):
+    r = metrics.Registry()
+    r.counter('x_total', 'xs').inc()
+    path = str(tmp_path / 'status.json')
+    r.write_status(path, uploader={'sent': 3})
+    with open(path) as f:
+        status = json.load(f)
+    assert status['metrics'] == {'x_total': 1}
+    assert status['uploader'] == {'sent': 3}
@@ -0,0 +1,107 @@
+# test_sampler.py
+
+import json
+import os
+import time
+import pytest
+import sampler
+
+
+@pytest.fixture
+def fake_sample(mocker):
+    calls = []
+
+    def sample():
+        calls.append(1)
+        time.sleep(.01)
+        return {'A1': 300, 'D2': 1, 'D3': 0, 'ts': str(len(calls))}
+
+    mocker.patch('sampler.sample', side_effect=sample)
+    mocker.patch.object(sampler.sigproc, 'compressor', None, create=True)
+    mocker.patch.object(sampler.sigproc, 'capture', None, create=True)
+    mocker.patch.object(sampler.config, 'status_path', None)
+    yield calls
+    sampler.stop(1)
+    sampler.snapshot = None
+    sampler.error = None
+
+
+def test_get_data_before_first_window():
+    assert sampler.get_data() is None
+
+
+def test_background_thread_publishes_snapshots(fake_sample):
+    sampler.start()
+    time.sleep(.1)
+    data = sampler.get_data()
+    sampler.stop(1)
+
+    assert not sampler.thread.is_alive()
+    assert len(fake_sample) > 1
+    assert data['A1'] == 300
+    with pytest.raises(TypeError):
+        data['A1'] = 0
+
+
+def test_get_data_does_not_wait_for_sampling(fake_sample):
+    sampler.start()
+    time.sleep(.05)
+    t0 = time.perf_counter()
+    for _ in range(1000):
+        sampler.get_data()
+    assert time.perf_counter() - t0 < .01
+
+
+def test_status_file(fake_sample, mocker, tmp_path):
+    path = str(tmp_path / 'status.json')
+    mocker.patch.object(sampler.config, 'status_path', path)
+    sampler.start()
+    time.sleep(.05)
+    sampler.stop(1)
+
+    with open(path) as f:
+        status = json.load(f)
+    assert status['snapshot']['A1'] == 300
+    assert 'sampler_window_seconds' in status['metrics']
+
+
+def test_failed_windows_are_printed_and_retried(fake_sample, mocker,
+                                                capsys):
+    mocker.patch.object(sampler, 'RETRY_SECONDS', .01)
+    sample = sampler.sample.side_effect
+    failing = [True]
+
+    def flaky():
+        if failing[0]:
+            raise OSError('board unplugged')
+        return sample()
+    mocker.patch('sampler.sample', side_effect=flaky)
+    sampler.start()
+    time.sleep(.05)
+
+    assert sampler.thread.is_alive() and not sampler.alive()
+    assert isinstance(sampler.error, OSError)
+    assert sampler.get_data() is None
+    # printed once, not on every retry
+    assert capsys.readouterr().out.count('sampling failed') == 1
+
+    failing[0] = False
+    time.sleep(.05)
+    assert sampler.alive() and sampler.get_data()['A1'] == 300
+    sampler.stop(1)
+    assert not sampler.alive()
+
+
+def test_calibrate_writes_lookups_to_path(mocker, tmp_path):
+    mocker.patch.object(sampler.sigproc, 'calibrate',
+                        return_value={'report': []})
+    mocker.patch.object(sampler.sigproc, 'format_lookups',
+                        return_value='a1_lookup = {}\n')
+    path = str(tmp_path / 'calibration.py')
+    sampler.calibrate(path)
+
+    with open(path) as f:
+        assert f.read() == 'a1_lookup = {}\n'
+    # by default next to sampler.py, not in the working directory
+    assert sampler.CALIBRATION_PATH == os.path.join(
+        os.path.dirname(os.path.abspath(sampler.__file__)), 'calibration.py')
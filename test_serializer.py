@@ -0,0 +1,125 @@
+# test_serializer.py
+
+import time
+import json
+import datetime
+import pytest
+import numpy as np
+import serializer
+
+dts = datetime.datetime(2021, 1, 1, 0, 0, 0, 250000)
+
+
+def test_json_template():
+    s = serializer.RecordSerializer('uno', ['A1', 'D2', 'D3'])
+    state = {'D3': 0, 'A1': 997.6, 'D2': True}
+    assert s.json(str(dts), state) == (
+        '{"ts":"2021-01-01 00:00:00.250000","src": "uno",'
+        '"A1": 997,"D2": 1,"D3": 0}')
+
+
+def test_json_single_pin_and_percent_in_src():
+    s = serializer.RecordSerializer('100%', ['A0'])
+    assert s.json('t', {'A0': 5}) == '{"ts":"t","src": "100%","A0": 5}'
+
+
+def test_binary_round_trip():
+    s = serializer.RecordSerializer('uno', ['A1', 'D2', 'D3'])
+    body = s.binary(dts, {'A1': 997, 'D2': 1, 'D3': 0})
+    body += s.binary(dts, {'A1': 3, 'D2': 0, 'D3': 1})
+
+    assert len(body) == 2 * serializer.BINARY_RECORD.size
+    assert serializer.decode_binary(body) == [
+        {'ts': str(dts), 'src': 'uno', 'A1': 997, 'D2': True, 'D3': False},
+        {'ts': str(dts), 'src': 'uno', 'A1': 3, 'D2': False, 'D3': True}]
+    # a record is 22 bytes, at most a third of the bytes of its json
+    one = s.binary(dts, {'A1': 997, 'D2': 1, 'D3': 0})
+    text = s.json(str(dts), {'A1': 997, 'D2': 1, 'D3': 0})
+    assert len(one) == 22
+    assert 3 * len(one) <= len(text) + 2
+
+
+def set_tz(monkeypatch, tz):
+    monkeypatch.setenv('TZ', tz)
+    time.tzset()
+
+
+@pytest.fixture
+def restore_tz(monkeypatch):
+    yield
+    monkeypatch.undo()
+    time.tzset()
+
+
+def test_binary_ts_is_the_same_on_any_timezone(monkeypatch, restore_tz):
+    s = serializer.RecordSerializer('uno', ['A1'])
+    fall_back = datetime.datetime(2021, 11, 7, 1, 30)   # twice in New York
+    set_tz(monkeypatch, 'America/New_York')   # the board
+    body = s.binary(dts, {'A1': 1}) + s.binary(fall_back, {'A1': 2})
+    set_tz(monkeypatch, 'Europe/Berlin')   # the server
+
+    # the ts strings the json format would have stored
+    assert [r['ts'] for r in serializer.decode_binary(body)] == [
+        str(dts), str(fall_back)]
+
+
+def test_src_is_checked_only_for_binary():
+    s = serializer.RecordSerializer('büro', ['A1'])   # json needs no ascii
+    assert json.loads(s.json('t', {'A1': 1}))['src'] == 'büro'
+    with pytest.raises(ValueError, match='ascii'):
+        s.binary(dts, {'A1': 1})
+    with pytest.raises(ValueError, match='ascii'):
+        serializer.RecordSerializer('büro', ['A1'], binary=True)
+    # cutting kitchen-north to 8 bytes would make it kitchen-
+    with pytest.raises(ValueError, match='at most 8'):
+        serializer.RecordSerializer('kitchen-north', ['A1'], binary=True)
+    s = serializer.RecordSerializer('kitchen1', ['A1'], binary=True)
+    record = serializer.decode_binary(s.binary(dts, {'A1': 1}))[0]
+    assert record['src'] == 'kitchen1'
+
+
+def test_binary_rejects_unknown_columns_and_bad_lengths():
+    s = serializer.RecordSerializer('uno', ['A5'])
+    with pytest.raises(ValueError):
+        s.binary(dts, {'A5': 1})
+    with pytest.raises(ValueError):
+        serializer.decode_binary(b'\0' * 23)
+
+
+def test_columns_round_trip():
+    body = serializer.encode_columns({
+        'id': ('<i8', [1, 2, 3]),
+        'ts': ('<M8[us]', [str(dts), '2021-01-01 00:00:01', '2021-01-02']),
+        'src': ('category', ['uno', None, 'uno']),
+        'A1': ('<f4', [997, None, 3.5]),
+        'D2': ('<f4', [1, 0, None])})
+    columns = serializer.decode_columns(body)
+
+    assert columns['id'].tolist() == [1, 2, 3]
+    assert columns['ts'][0] == np.datetime64('2021-01-01T00:00:00.250000')
+    assert columns['ts'][2] == np.datetime64('2021-01-02')
+    assert columns['src'].tolist() == ['uno', None, 'uno']
+    assert columns['A1'][[0, 2]].tolist() == [997, 3.5]
+    assert np.isnan(columns['A1'][1]) and np.isnan(columns['D2'][2])
+    # packed: 8 + 8 + 4 + 4 + 4 bytes a row, padded per column, + header
+    assert len(body) < 5 * 8 * 3 + 300
+
+
+def test_columns_empty_and_ragged():
+    columns = serializer.decode_columns(serializer.encode_columns(
+        {'id': ('<i8', []), 'src': ('category', [])}))
+    assert len(columns['id']) == len(columns['src']) == 0
+    with pytest.raises(ValueError):
+        serializer.encode_columns({'id': ('<i8', [1]), 'A1': ('<f4', [])})
+
+
+def test_narrow_json_sends_only_changed_pins():
+    s = serializer.RecordSerializer('uno', ['A1', 'D2', 'D3'])
+    saved = {}
+
+    assert s.narrow_json('t0', {'A1': 997.6, 'D2': True, 'D3': 0}, saved) == (
+        '{"ts":"t0","src": "uno","values": {"A1": 997, "D2": 1, "D3": 0}}')
+    assert s.narrow_json('t1', {'A1': 997.2, 'D2': 0, 'D3': 0}, saved) == (
+        '{"ts":"t1","src": "uno","values": {"D2": 0}}')
+    assert s.narrow_json('t2', {'A1': 997, 'D2': 0, 'D3': 0}, saved) is None
+    assert saved == {'A1': 997, 'D2': 0, 'D3': 0}
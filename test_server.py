@@ -0,0 +1,402 @@
+# test_server.py
+
+import os
+import sys
+import gzip
+import json
+import datetime
+import pytest
+import numpy as np
+from fastapi.testclient import TestClient
+import serializer
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             'sql_app'))
+import main  # noqa: E402
+import cache  # noqa: E402
+
+AUTH = {'Authorization': 'Bearer garth'}
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    """ the server on an empty signals.db in tmp_path """
+    monkeypatch.chdir(tmp_path)
+    main.response_cache.clear()
+    with TestClient(main.app) as c:
+        c.headers.update(AUTH)
+        yield c
+
+
+def record(i, src='uno', **pins):
+    ts = datetime.datetime(2021, 1, 1) + datetime.timedelta(seconds=30 * i)
+    return {'ts': str(ts), 'src': src, 'A1': i, 'D2': i % 2 == 0, **pins}
+
+
+def post_records(client, n, **kw):
+    response = client.post('/pins/batch',
+                           json=[record(i, **kw) for i in range(n)])
+    assert response.status_code == 200
+    return response.json()
+
+
+def test_create_pins_json_and_binary(client):
+    r = client.post('/pins', json=record(0))
+    assert r.status_code == 200 and r.json()['id'] == 1
+
+    body = serializer.RecordSerializer('uno', ['A1', 'D2']).binary(
+        datetime.datetime(2021, 1, 1, 0, 1), {'A1': 7, 'D2': 1})
+    r = client.post('/pins', content=body,
+                    headers={'Content-Type': serializer.BINARY_MEDIA_TYPE})
+
+    assert r.status_code == 200
+    assert r.json() == {'ts': '2021-01-01 00:01:00', 'src': 'uno', 'A0': None,
+                        'A1': 7, 'D2': True, 'D3': None, 'id': 2}
+
+
+def test_batch_json_ndjson_and_binary(client):
+    assert post_records(client, 3) == {'count': 3, 'first_id': 1,
+                                       'last_id': 3}
+
+    ndjson = '\n'.join(json.dumps(record(i)) for i in range(3, 5)) + '\n'
+    r = client.post('/pins/batch', content=ndjson,
+                    headers={'Content-Type': main.NDJSON_MEDIA_TYPE})
+    assert r.json() == {'count': 2, 'first_id': 4, 'last_id': 5}
+
+    s = serializer.RecordSerializer('uno', ['A1', 'D2'])
+    dts = datetime.datetime(2021, 1, 2)
+    body = b''.join(s.binary(dts, {'A1': i, 'D2': 0}) for i in range(2))
+    r = client.post('/pins/batch', content=body,
+                    headers={'Content-Type': serializer.BINARY_MEDIA_TYPE})
+    assert r.json() == {'count': 2, 'first_id': 6, 'last_id': 7}
+
+    a1 = [p['A1'] for p in client.get('/pins').json()]
+    assert a1 == [0, 1, 2, 3, 4, 0, 1]
+    assert client.post('/pins/batch', json=[]).json() == {
+        'count': 0, 'first_id': None, 'last_id': None}
+
+
+def test_batch_rejects_bad_bodies(client, monkeypatch):
+    assert client.post('/pins/batch', content='[{').status_code == 400
+    assert client.post('/pins/batch', json=record(0)).status_code == 400
+    r = client.post('/pins/batch', content=b'\0' * 5,
+                    headers={'Content-Type': serializer.BINARY_MEDIA_TYPE})
+    assert r.status_code == 400
+
+    r = client.post('/pins/batch', json=[record(0), {'src': 'uno'},
+                                         record(2), {'ts': 't', 'A1': 'x'}])
+    assert r.status_code == 422
+    assert [e['index'] for e in r.json()['detail']] == [1, 3]
+
+    monkeypatch.setattr(main, 'MAX_BATCH', 2)
+    r = client.post('/pins/batch', json=[record(i) for i in range(3)])
+    assert r.status_code == 413
+    # nothing of the rejected batches was stored
+    assert client.get('/pins').json() == []
+
+
+def test_metrics(client):
+    post_records(client, 2)
+    r = client.get('/metrics')
+
+    assert r.headers['content-type'] == (
+        'text/plain; version=0.0.4; charset=utf-8')
+    assert '# TYPE pins_inserted_total counter' in r.text
+    assert 'db_insert_seconds_count' in r.text
+    assert 'http_request_seconds_bucket{le="+Inf"}' in r.text
+
+
+def test_pool_reuses_tuned_connections(client):
+    pool = main.database._backend._pool
+    for _ in range(5):
+        client.get('/pins')
+
+    assert 1 <= len(pool.idle) <= pool.max_size
+    mode = client.portal.call(main.database.fetch_val, 'PRAGMA journal_mode')
+    assert mode == 'wal'
+    sync = client.portal.call(main.database.fetch_val, 'PRAGMA synchronous')
+    assert sync == 1   # NORMAL
+
+
+def test_read_pins_filters(client):
+    post_records(client, 6)
+    post_records(client, 2, src='duo')
+
+    pins = client.get('/pins').json()   # no limit: every record
+    assert len(pins) == 8
+    assert [p['ts'] for p in pins] == sorted(p['ts'] for p in pins)
+    r = client.get('/pins', params={'since': '2021-01-01T00:01:00',
+                                    'until': '2021-01-01T00:02:00',
+                                    'src': 'uno'})
+    assert [p['A1'] for p in r.json()] == [2, 3]
+    assert 'X-Next-Cursor' not in r.headers
+
+
+def test_read_pins_cursor_pages_to_the_end(client):
+    post_records(client, 5)
+    post_records(client, 5)   # same ts again: pages split between them
+
+    ids, params, pages = [], {'limit': 3}, 0
+    while True:
+        r = client.get('/pins', params=params)
+        ids += [p['id'] for p in r.json()]
+        pages += 1
+        cursor = r.headers.get('X-Next-Cursor')
+        if cursor is None:
+            break
+        params['after'] = cursor
+
+    assert pages == 4
+    assert ids == [1, 6, 2, 7, 3, 8, 4, 9, 5, 10]
+    # a full last page still gets a cursor, and the page after it is empty
+    r = client.get('/pins', params={'limit': 10})
+    params = {'limit': 10, 'after': r.headers['X-Next-Cursor']}
+    r = client.get('/pins', params=params)
+    assert r.json() == [] and 'X-Next-Cursor' not in r.headers
+    assert client.get('/pins', params={'after': 'nope'}).status_code == 400
+    assert client.get('/pins', params={'limit': 0}).status_code == 422
+
+
+def test_read_pins_unpaged_without_limit(client):
+    post_records(client, main.PAGE_SIZE + 1)
+
+    r = client.get('/pins')
+    assert len(r.json()) == main.PAGE_SIZE + 1
+    assert 'X-Next-Cursor' not in r.headers
+
+
+def test_aggregate_buckets(client):
+    post_records(client, 6)   # every 30 secs: two records per minute
+
+    r = client.get('/pins/aggregate', params={'bucket': '1m'})
+    rows = r.json()
+
+    assert [row['bucket'] for row in rows] == [
+        '2021-01-01 00:00:00', '2021-01-01 00:01:00', '2021-01-01 00:02:00']
+    assert [row['count'] for row in rows] == [2, 2, 2]
+    assert [row['A1_mean'] for row in rows] == [.5, 2.5, 4.5]
+    assert [(row['A1_min'], row['A1_max']) for row in rows] == [
+        (0, 1), (2, 3), (4, 5)]
+    assert [row['D2_last'] for row in rows] == [0, 0, 0]
+    assert [row['D2_duty'] for row in rows] == [.5, .5, .5]
+    assert rows[0]['D3_last'] is None and rows[0]['A0_count'] == 0
+    r = client.get('/pins/aggregate', params={'bucket': '90'})
+    assert [row['count'] for row in r.json()] == [3, 3]
+    for bad in ('0m', 'x', '1w'):
+        r = client.get('/pins/aggregate', params={'bucket': bad})
+        assert r.status_code == 400
+
+
+def test_aggregate_refuses_more_than_max_buckets(client, monkeypatch):
+    monkeypatch.setattr(main, 'MAX_BUCKETS', 2)
+    post_records(client, 6)
+
+    r = client.get('/pins/aggregate', params={'bucket': '1m'})
+    assert r.status_code == 400 and 'More than 2 buckets' in r.text
+    r = client.get('/pins/aggregate', params={'bucket': '90'})
+    assert [row['count'] for row in r.json()] == [3, 3]
+    r = client.get('/pins/aggregate', params={
+        'bucket': '1m', 'since': '2021-01-01T00:01:00'})
+    assert [row['count'] for row in r.json()] == [2, 2]
+
+
+def test_stream_ndjson_and_gzip(client, monkeypatch):
+    monkeypatch.setattr(main, 'STREAM_CHUNK_ROWS', 2)
+    post_records(client, 5)
+
+    r = client.get('/pins/stream', params={'src': 'uno'},
+                   headers={'Accept-Encoding': 'identity'})
+    assert r.headers['content-type'] == main.NDJSON_MEDIA_TYPE
+    assert 'content-encoding' not in r.headers
+    lines = [json.loads(line) for line in r.text.splitlines()]
+    assert lines == client.get('/pins').json()
+
+    with client.stream('GET', '/pins/stream',
+                       headers={'Accept-Encoding': 'gzip'}) as gz:
+        raw = b''.join(gz.iter_raw())
+    assert gz.headers['content-encoding'] == 'gzip'
+    assert gzip.decompress(raw) == r.content
+    assert client.get('/pins/stream', params={'src': 'x'}).content == b''
+
+
+def test_columns_and_binary_formats(client):
+    post_records(client, 4)
+    rows = client.get('/pins').json()
+
+    columns = client.get('/pins', params={'format': 'columns'}).json()
+    assert columns['ts'] == [p['ts'] for p in rows]
+    assert columns['A1'] == [0, 1, 2, 3]
+    assert columns['D2'] == [True, False, True, False]
+
+    r = client.get('/pins', params={'format': 'binary', 'limit': 3})
+    assert r.headers['content-type'] == serializer.COLUMNS_MEDIA_TYPE
+    assert 'X-Next-Cursor' in r.headers
+    binary = serializer.decode_columns(r.content)
+    assert binary['id'].tolist() == [1, 2, 3]
+    assert binary['ts'][1] == np.datetime64('2021-01-01T00:00:30')
+    assert binary['src'].tolist() == ['uno'] * 3
+    assert binary['D2'].tolist() == [1, 0, 1]
+    assert np.isnan(binary['A0']).all()
+    assert client.get('/pins', params={'format': 'xml'}).status_code == 422
+
+
+def test_etag_304_and_cache(client):
+    post_records(client, 3)
+    r = client.get('/pins')
+    etag = r.headers['ETag']
+    assert r.headers['Cache-Control'] == 'no-cache'
+
+    hits = main.CACHE_HITS.value
+    assert client.get('/pins').content == r.content
+    assert main.CACHE_HITS.value == hits + 1
+    r304 = client.get('/pins', headers={'If-None-Match': etag})
+    assert r304.status_code == 304 and r304.content == b''
+    assert client.get('/pins', params={'src': 'uno'},
+                      headers={'If-None-Match': etag}).status_code == 200
+
+    client.post('/pins', json=record(3))
+    r = client.get('/pins', headers={'If-None-Match': etag})
+    assert r.status_code == 200 and len(r.json()) == 4
+    assert r.headers['ETag'] != etag
+    agg = client.get('/pins/aggregate', params={'bucket': '1h'})
+    r = client.get('/pins/aggregate', params={'bucket': '1h'},
+                   headers={'If-None-Match': agg.headers['ETag']})
+    assert r.status_code == 304
+
+
+def test_response_cache_evicts_oldest():
+    c = cache.ResponseCache(max_entries=2, max_bytes=10)
+    c.put('a', b'1234', 'x', {})
+    c.put('b', b'1234', 'x', {})
+    c.get('a')
+    c.put('c', b'12', 'x', {})     # over max_entries: b, least recent, goes
+    assert list(c.entries) == ['a', 'c']
+    c.put('d', b'123456', 'x', {})  # over max_bytes: a goes
+    assert list(c.entries) == ['c', 'd'] and c.bytes == 8
+    c.put('e', b'x' * 11, 'x', {})  # larger than max_bytes: not kept
+    assert c.get('e') is None
+
+
+def test_etag_matches():
+    etag = cache.make_etag(3, '/pins', main.Request(
+        {'type': 'http', 'query_string': b'b=1&a=2'}).query_params)
+    same = cache.make_etag(3, '/pins', main.Request(
+        {'type': 'http', 'query_string': b'a=2&b=1'}).query_params)
+    assert etag == same
+    assert cache.etag_matches(f'"x", W/{etag}', etag)
+    assert cache.etag_matches('*', etag)
+    assert not cache.etag_matches(None, etag)
+    assert not cache.etag_matches('"4-0"', etag)
+
+
+VALUES = [
+    {'ts': '2021-01-01 00:00:00', 'src': 'uno',
+     'values': {'A1': 997, 'D2': 1, 'D3': 0}},
+    {'ts': '2021-01-01 00:01:00', 'src': 'uno', 'values': {'D2': 0}},
+    {'ts': '2021-01-01 00:01:00', 'src': 'duo', 'values': {'A0': 5}},
+    {'ts': '2021-01-01 00:02:00.5', 'src': 'uno', 'values': {'A1': 990}},
+    {'ts': '2021-01-01 00:03:00', 'src': 'uno', 'values': {'D3': 1}},
+]
+
+
+def test_pin_values_forward_fill(client):
+    r = client.post('/pin_values/batch', json=VALUES[:4])
+    assert r.json() == {'count': 6, 'first_id': 1, 'last_id': 6}
+    assert client.post('/pin_values', json=VALUES[4]).json()['last_id'] == 7
+    r = client.post('/pin_values/batch',
+                    json=[{'ts': 'x', 'src': 'uno', 'values': {}}])
+    assert r.status_code == 422 and r.json()['detail'][0]['index'] == 0
+
+    rows = client.get('/pin_values', params={'src': 'uno'}).json()
+
+    assert rows == [
+        {'ts': '2021-01-01 00:00:00', 'src': 'uno',
+         'A1': 997, 'D2': 1, 'D3': 0},
+        {'ts': '2021-01-01 00:01:00', 'src': 'uno',
+         'A1': 997, 'D2': 0, 'D3': 0},
+        {'ts': '2021-01-01 00:02:00.500000', 'src': 'uno',
+         'A1': 990, 'D2': 0, 'D3': 0},
+        {'ts': '2021-01-01 00:03:00', 'src': 'uno',
+         'A1': 990, 'D2': 0, 'D3': 1}]
+    both = client.get('/pin_values').json()
+    # every pin of both srcs, null where a src never had it
+    assert both[1] == {'ts': '2021-01-01 00:01:00', 'src': 'duo', 'A0': 5,
+                       'A1': None, 'D2': None, 'D3': None}
+    assert client.get('/pin_values', params={'src': 'none'}).json() == []
+
+
+def test_pin_values_since_takes_earlier_values(client):
+    client.post('/pin_values/batch', json=VALUES)
+
+    rows = client.get('/pin_values', params={
+        'since': '2021-01-01T00:01:30', 'until': '2021-01-01T00:03:00',
+        'src': 'uno'}).json()
+
+    # A1 changed in range; D2 and D3 are their values from before since
+    assert rows == [{'ts': '2021-01-01 00:02:00.500000', 'src': 'uno',
+                     'A1': 990, 'D2': 0, 'D3': 0}]
+
+
+def test_pin_values_pages_end_on_whole_timestamps(client):
+    client.post('/pin_values/batch', json=VALUES)
+
+    pages, params = [], {'limit': 2}
+    while True:
+        r = client.get('/pin_values', params=params)
+        pages.append([(row['ts'][11:19], row['src']) for row in r.json()])
+        if 'X-Next-Cursor' not in r.headers:
+            break
+        params['after'] = r.headers['X-Next-Cursor']
+
+    assert pages == [
+        [('00:00:00', 'uno')],   # 3 values at one ts: more than limit
+        [('00:01:00', 'duo'), ('00:01:00', 'uno')],
+        [('00:02:00', 'uno'), ('00:03:00', 'uno')],
+        []]
+    # the page after a cursor still carries the values from before it
+    after = main.epoch_us('2021-01-01 00:01:00')
+    r = client.get('/pin_values', params={'after': after, 'src': 'uno'})
+    assert r.json()[0] == {'ts': '2021-01-01 00:02:00.500000', 'src': 'uno',
+                           'A1': 990, 'D2': 0, 'D3': 0}
+
+
+def test_pin_values_formats_and_etag(client):
+    client.post('/pin_values/batch', json=VALUES)
+
+    columns = client.get('/pin_values', params={'format': 'columns',
+                                                'src': 'uno'}).json()
+    assert columns['D3'] == [0, 0, 0, 1]
+    assert columns['ts'][2] == '2021-01-01 00:02:00.500000'
+    r = client.get('/pin_values', params={'format': 'binary'})
+    binary = serializer.decode_columns(r.content)
+    assert binary['ts'][3] == np.datetime64('2021-01-01T00:02:00.5')
+    assert binary['src'].tolist() == ['uno', 'duo', 'uno', 'uno', 'uno']
+    assert binary['A0'][1] == 5 and np.isnan(binary['A0'][0])
+
+    etag = r.headers['ETag']
+    assert client.get('/pin_values', params={'format': 'binary'},
+                      headers={'If-None-Match': etag}).status_code == 304
+    client.post('/pin_values', json=VALUES[0])
+    assert client.get('/pin_values', params={'format': 'binary'},
+                      headers={'If-None-Match': etag}).status_code == 200
+
+
+def test_wide_rows():
+    state = {'uno': {'A1': 1, 'D2': 0}}
+    rows = [(10, 'uno', 'D2', 1), (10, 'uno', 'A1', 2), (10, 'duo', 'A0', 3),
+            (20, 'uno', 'D2', 0)]
+    # rows are ordered by ts, src in the db; duo before uno at one ts
+    rows = [rows[2], rows[0], rows[1], rows[3]]
+
+    assert main.wide_rows(rows, state) == [
+        (10, 'duo', {'A0': 3}),
+        (10, 'uno', {'A1': 2, 'D2': 1}),
+        (20, 'uno', {'A1': 2, 'D2': 0})]
+    assert state == {'uno': {'A1': 2, 'D2': 0}, 'duo': {'A0': 3}}
+    assert main.wide_rows([], {}) == []
+
+
+def test_epoch_us():
+    assert main.epoch_us('1970-01-01 00:00:01.5') == 1500000
+    us = main.epoch_us('2021-01-01 00:02:00.25')
+    assert main.epoch_str(us) == '2021-01-01 00:02:00.250000'
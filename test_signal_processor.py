@@ -1,9 +1,19 @@
 # test_quick_signal_processor.py
 
+import time
+import threading
 import pytest
+import random
 import mock_config
 import datetime
 import signal_processor
+import async_signal_processor
+import asyncio
+import filters
+import compression
+import serializer
+import capture
+import numpy as np
 import pdb
 from pyfirmata import Arduino, util, Pin
 
@@ -13,6 +23,7 @@ X indicates that a test exists and passes. NA means didn't bother.
 InputPin:
     X def __init__(self, name):
     X def __repr__(self):
+    X def update(self, raw):
 
 ArduinoSignalProcessor:
     X def initialize(self, config, Arduino, util, timestamp):
@@ -21,13 +32,32 @@ ArduinoSignalProcessor:
     X def set_db_interval(self, a2d):
     X def set_analog_num(self, a2d):
     X def collect_inputs(self):
+    X def begin_window(self):
+    X def sample_tick(self, window, i):
+    X def end_window(self, window):
+    X def ticks(self, num=None):
     X def get_reader(self, type, pin, board):
     X def smooth_analog(self, pin):
     X def smooth_digital(self, pin):
+    X def bounce_counts(self):
+    X def calibrate(self, spacings, counts, repeats, target_3sigma):
+    X def format_lookups(self, calibration):
+    X def set_sample_interval(self, a2d):
+    X def track_noise(self, name, a2d):
+    X def noise(self, name):
+    X def envelope(self, name):
     X def changed(self, ts):
-    X def json_encode(self, datetimestamp):
+    X def compress(self, datetimestamp):
+    X def json_encode(self, datetimestamp, state=None):
+    X def encode(self, datetimestamp, state=None):
     X def update_db(self, dts):
 
+AsyncArduinoSignalProcessor:
+    X async def collect_inputs(self):
+    X async def changed(self, ts):
+    X async def update_db(self, datetimestamp):
+    X async def run(self, now, on_data=None, count=None):
+
 """
 
 
@@ -92,6 +122,11 @@ class MockSignalProcessor(signal_processor.ArduinoSignalProcessor):
             return read_analog_mock(10, 1)
 
 
+class MockAsyncSignalProcessor(
+        async_signal_processor.AsyncArduinoSignalProcessor):
+    get_reader = MockSignalProcessor.get_reader
+
+
 class MockResponse:
     def __init__(self, json_data, status_code):
         self.json_data = json_data
@@ -156,6 +191,15 @@ def mock_readers(mockArduino, mockutil, mockdatetime):
     return mockproc
 
 
+@pytest.fixture
+def async_readers(mockArduino, mockutil, mockdatetime):
+    proc = MockAsyncSignalProcessor()
+    proc.initialize(mock_config, mockArduino, mockutil,
+                    mockdatetime.timestamp())
+    proc.sample_interval = 0
+    return proc
+
+
 # -------------Tests ---------------------
 
 
@@ -175,6 +219,14 @@ def test_repr():
     assert r == 'digital 12 0'
 
 
+def test_update_InputPin():
+    ip = signal_processor.InputPin('A1')
+    assert ip.update(7) == 7
+    ip.filter = filters.RollingMean(2)
+    ip.update(10)
+    assert ip.update(20) == 15 and ip.value == 15
+
+
 def test_initialize(mocker, mock_proc, mockdatetime):
     assert mock_proc.src == mock_config.src
     assert mock_proc.db_interval == mock_config.initial_db_interval
@@ -195,6 +247,8 @@ def test_initialize(mocker, mock_proc, mockdatetime):
     assert mock_proc.db_saved == mockdatetime.timestamp()
     assert len(mock_proc.apins) == 1
     assert len(mock_proc.dpins) == 2
+    assert type(mock_proc.apins[0].filter) == filters.RollingMean
+    assert mock_proc.apins[0].filter.size == mock_config.initial_analog_num
 
 
 def test_setup_analog(mock_proc, mock_board):
@@ -245,31 +299,61 @@ def test_set_analog_num(mock_proc):
     assert mock_proc.analog_num == 10
 
 
-def test_collect_inputs(mock_proc, mocker):
-    mocker.patch("signal_processor.ArduinoSignalProcessor.smooth_analog",
-                 return_value=307)
-    mocker.patch("signal_processor.ArduinoSignalProcessor.smooth_digital",
-                 return_value=1)
+def test_collect_inputs(mock_readers, mocker):
+    """
+    All pins are read on every tick of one window: analog_num=10 reads of
+    the analog mock average to 300, D2 settles on 1 and D3 on 0.
+    """
     mocker.patch("signal_processor.ArduinoSignalProcessor.set_analog_num")
     mocker.patch("signal_processor.ArduinoSignalProcessor.set_db_interval")
-    a1 = 1
-    d2 = 2
-    d3 = 3
-    a2d = 307
-    # pdb.set_trace()
+    mocker.spy(mock_readers, 'get_reader')
 
-    mock_proc.collect_inputs()
+    mock_readers.collect_inputs()
 
-    assert mock_proc.smooth_analog.call_count == 1
-    assert mock_proc.smooth_digital.call_count == 2
-    assert mock_proc.smooth_analog.called_once_with(a1)
-    assert mock_proc.smooth_digital.called_with(d2)
-    assert mock_proc.smooth_digital.called_with(d3)
-    assert mock_proc.set_analog_num.called_with(a2d)
-    assert mock_proc.set_db_interval.called_with(a2d)
-    # pdb.set_trace()
-    assert mock_proc.current_state['A1'] == 307
-    assert mock_proc.current_state['D2'] == 1
+    assert mock_readers.get_reader.call_count == 3
+    mock_readers.set_analog_num.assert_called_once_with(300)
+    mock_readers.set_db_interval.assert_called_once_with(300)
+    assert mock_readers.current_state['A1'] == 300
+    assert mock_readers.current_state['D2'] == 1
+    assert mock_readers.current_state['D3'] == 0
+
+
+def test_collect_inputs_unsettled_digital(mock_readers, mocker):
+    """
+    a digital pin that never settles keeps its last-known-good value,
+    reads stop at digital_read_budget and the pin is flagged as bouncing
+    """
+    mocker.patch("signal_processor.ArduinoSignalProcessor.set_analog_num")
+    mocker.patch("signal_processor.ArduinoSignalProcessor.set_db_interval")
+    digital[2] = list('01' * 32)
+    d2 = mock_readers.dpins[0]
+    d2.filter = filters.Debouncer(5, 1)
+    try:
+        mock_readers.collect_inputs()
+    finally:
+        digital[2] = list(bin(14987979559889010687))[2:]
+
+    assert mock_readers.current_state['D2'] == 1
+    assert d2.filter.bouncing
+    # every budgeted read after the first reverts an unsettled level
+    assert d2.filter.bounces == mock_readers.digital_read_budget - 1
+
+
+def test_ticks_deadlines(mock_proc, mocker):
+    """ deadlines come from the window start, so oversleeping never drifts """
+    now = [100.0]
+    mocker.patch('signal_processor.time.monotonic', side_effect=lambda: now[0])
+    sleeps = []
+
+    def oversleep(secs):
+        sleeps.append(round(secs, 6))
+        now[0] += secs + .03
+
+    mocker.patch('signal_processor.time.sleep', side_effect=oversleep)
+    mock_proc.sample_interval = .1
+
+    assert list(mock_proc.ticks(4)) == [0, 1, 2, 3]
+    assert sleeps == [.1, .07, .07]
 
 
 def test_get_mock_reader(mock_readers, mocker):
@@ -325,6 +409,75 @@ def test_smooth_digital(mock_readers):
     assert val[3] == 0
 
 
+def test_smooth_digital_is_bounded(mock_readers):
+    """ an alternating bit stream returns after digital_read_budget reads """
+    digital[2] = list('10' * 32)
+    try:
+        val = mock_readers.smooth_digital(2)
+    finally:
+        digital[2] = list(bin(14987979559889010687))[2:]
+
+    assert val == 0
+    assert mock_readers.dpins[0].filter.bouncing
+    assert mock_readers.bounce_counts() == {'D2': 19, 'D3': 0}
+
+
+def test_smooth_digital_without_debouncer(mock_readers):
+    """ a pin that is not configured is read once and passed through """
+    d3 = mock_readers.dpins.pop()
+    assert d3.pin == 3
+    assert mock_readers.smooth_digital(3) == 1   # the first bit of D3
+    assert not d3.filter.bouncing and d3.value == 0
+
+
+class read_noisy_mock:
+    """ a steady level of 300 counts with gaussian noise of 4 counts """
+
+    def __init__(self, seed):
+        self.rnd = random.Random(seed)
+
+    def read(self):
+        return (300 + self.rnd.gauss(0, 4)) / 1023
+
+
+def test_calibrate(mock_proc, mocker):
+    mocker.patch.object(mock_proc, 'get_reader',
+                        return_value=read_noisy_mock(1))
+    mock_proc.sample_interval = .1
+    # 3 sigma of the mean of n reads is 12 / sqrt(n): 12, 6, 3, 1.5
+    cal = mock_proc.calibrate([0], [1, 4, 16, 64], 50, 4.0)
+
+    assert len(cal['report']) == 4
+    sigma3 = [r['sigma3'] for r in cal['report']]
+    assert sigma3 == sorted(sigma3, reverse=True)
+    assert sigma3[2] <= 4.0 < sigma3[1]
+    # 300 counts falls in the bucket keyed 2048
+    assert cal['analog_num_lookup'] == {25: 10, 50: 10, 100: 10, 2048: 16}
+    assert cal['sample_interval_lookup'] == {
+        25: .1, 50: .1, 100: .1, 2048: 0}
+    assert mock_proc.sample_interval == .1
+    assert mock_proc.format_lookups(cal) == (
+        'analog_num_lookup = {25: 10, 50: 10, 100: 10, 2048: 16}\n'
+        'sample_interval_lookup = {25: 0.1, 50: 0.1, 100: 0.1, 2048: 0}\n')
+
+
+def test_calibrate_needs_two_repeats(mock_proc, mocker):
+    reader = mocker.patch.object(mock_proc, 'get_reader')
+    with pytest.raises(ValueError, match='repeats >= 2'):
+        mock_proc.calibrate([0], [1, 4], 1)
+    reader.return_value.read.assert_not_called()
+
+
+def test_set_sample_interval(mock_proc):
+    mock_proc.sample_interval_lookup = None
+    mock_proc.sample_interval = .1
+    mock_proc.set_sample_interval(300)
+    assert mock_proc.sample_interval == .1
+    mock_proc.sample_interval_lookup = {100: .05, 2048: .02}
+    mock_proc.set_sample_interval(300)
+    assert mock_proc.sample_interval == .02
+
+
 def test_changed(mock_proc, mockdatetime):
     mock_proc.db_saved = mockdatetime.timestamp()
 
@@ -344,6 +497,48 @@ def test_changed(mock_proc, mockdatetime):
     assert mock_proc.former_state == mock_proc.current_state
 
 
+def test_track_noise(mock_proc):
+    rnd = random.Random(5)
+    assert mock_proc.envelope('A1') is None
+    for _ in range(500):
+        mock_proc.track_noise('A1', round(300 + rnd.gauss(0, 3)))
+    assert 2.5 < mock_proc.noise('A1') < 3.5
+    count = mock_proc.noise_stats['A1'].count
+    # a real move is kept out of the noise stats
+    mock_proc.track_noise('A1', 400)
+    assert mock_proc.noise_stats['A1'].count == count
+
+
+def test_quiet_warm_up_still_learns_noise(mock_proc, mockdatetime):
+    for _ in range(mock_proc.noise_min_samples + 1):
+        mock_proc.track_noise('A1', 300)   # no steps at all
+    assert mock_proc.envelope('A1') == signal_processor.A2D_QUANTUM
+    mock_proc.former_state['A1'] = 300
+    mock_proc.current_state['A1'] = 301
+    assert not mock_proc.changed(mockdatetime.timestamp() + 90)
+    # 1 count wiggles are still fed to the stats, so the envelope grows
+    count = mock_proc.noise_stats['A1'].count
+    for i in range(200):
+        mock_proc.track_noise('A1', 300 + i % 2)
+    assert mock_proc.noise_stats['A1'].count == count + 200
+    assert mock_proc.envelope('A1') > signal_processor.A2D_QUANTUM
+
+
+def test_changed_suppresses_noise(mock_proc, mockdatetime):
+    ts = mockdatetime.timestamp() + 90
+    mock_proc.noise_stats['A1'].count = mock_proc.noise_min_samples
+    mock_proc.noise_stats['A1'].m2 = (
+        2.0 * 4 * (mock_proc.noise_min_samples - 1))
+    assert mock_proc.envelope('A1') == pytest.approx(6)
+    mock_proc.former_state['A1'] = 300
+    mock_proc.current_state['A1'] = 305
+    assert not mock_proc.changed(ts)
+    assert mock_proc.former_state['A1'] == 300
+    mock_proc.current_state['A1'] = 307
+    assert mock_proc.changed(ts)
+    assert mock_proc.former_state['A1'] == 307
+
+
 def test_json_encode(mock_proc, mockdatetime):
     # pdb.set_trace()
     mock_proc.current_state['A1'] = 307
@@ -354,6 +549,36 @@ def test_json_encode(mock_proc, mockdatetime):
     assert jsn == '{"ts":"2021-01-01 00:00:00","src": "test","A1": 307,"D2": 1,"D3": 0}'  # noqa: E501
 
 
+def test_json_encode_state(mock_proc, mockdatetime):
+    jsn = mock_proc.json_encode(mockdatetime, {'A1': 5, 'D2': 0, 'D3': 1})
+    assert jsn == ('{"ts":"2021-01-01 00:00:00","src": "test",'
+                   '"A1": 5,"D2": 0,"D3": 1}')
+
+
+def test_encode_binary(mock_proc, mockdatetime):
+    mock_proc.current_state.update({'A1': 307, 'D2': 1, 'D3': 0})
+    assert mock_proc.encode(mockdatetime)[1] == {}
+    mock_proc.wire_format = 'binary'
+
+    body, headers = mock_proc.encode(mockdatetime)
+
+    assert headers == {'Content-Type': 'application/octet-stream'}
+    assert serializer.decode_binary(body) == [
+        {'ts': '2021-01-01 00:00:00', 'src': 'test',
+         'A1': 307, 'D2': True, 'D3': False}]
+
+
+def test_compress(mock_proc, mockdatetime):
+    mock_proc.compressor = compression.RecordCompressor(
+        {'A1': 2, 'D2': 0, 'D3': 0})
+    mock_proc.current_state.update({'A1': 307, 'D2': 1, 'D3': 0})
+
+    assert mock_proc.compress(mockdatetime) == [
+        (mockdatetime, {'A1': 307, 'D2': 1, 'D3': 0})]
+    later = mockdatetime + datetime.timedelta(seconds=1)
+    assert mock_proc.compress(later) == []
+
+
 def test_update_db(mocker, mock_proc, mockdatetime, mocked_http_response):
     mocker.patch('signal_processor.requests.post',
                  return_value=mocked_http_response)
@@ -367,3 +592,242 @@ def test_update_db(mocker, mock_proc, mockdatetime, mocked_http_response):
     signal_processor.requests.post.called_once()
     assert response.status_code == 200
     assert response.json() == '{"test": "passed"}'
+
+
+def test_async_collect_inputs(async_readers, mocker):
+    mocker.patch("signal_processor.ArduinoSignalProcessor.set_analog_num")
+    mocker.patch("signal_processor.ArduinoSignalProcessor.set_db_interval")
+
+    asyncio.run(async_readers.collect_inputs())
+
+    assert async_readers.current_state == {'A1': 300, 'D2': 1, 'D3': 0}
+
+
+def test_async_changed(async_readers, mockdatetime):
+    async_readers.current_state['D2'] = 1
+    assert asyncio.run(async_readers.changed(mockdatetime.timestamp() + 90))
+    assert async_readers.former_state['D2'] == 1
+
+
+def test_async_update_db(async_readers, mocker, mockdatetime,
+                         mocked_http_response):
+    post = mocker.patch.object(async_readers.client, 'post',
+                               return_value=mocked_http_response)
+    async_readers.current_state.update({'A1': 307, 'D2': 1, 'D3': 0})
+
+    response = asyncio.run(async_readers.update_db(mockdatetime))
+
+    post.assert_awaited_once_with(
+        mock_config.db_url,
+        content='{"ts":"2021-01-01 00:00:00","src": "test",'
+                '"A1": 307,"D2": 1,"D3": 0}',
+        headers={})
+    assert response.status_code == 200
+    assert async_readers.db_saved == mockdatetime.timestamp()
+
+
+def test_async_run_does_not_wait_for_posts(async_readers, mocker,
+                                           mockdatetime):
+    """ a slow post overlaps the following windows instead of delaying them """
+    windows = []
+    posted = []
+
+    async def slow_post(body, headers):
+        await asyncio.sleep(.2)
+        posted.append(len(windows))
+
+    mocker.patch.object(async_readers, 'post', side_effect=slow_post)
+    mocker.patch.object(async_readers, 'changed', return_value=True)
+
+    asyncio.run(async_readers.run(lambda: mockdatetime, windows.append, 3))
+
+    assert len(windows) == 3
+    # every post finished only after all three windows were sampled
+    assert posted == [3, 3, 3]
+
+
+def test_async_run_prints_failed_posts(async_readers, mocker, mockdatetime,
+                                       capsys):
+    mocker.patch.object(async_readers, 'post',
+                        side_effect=OSError('connection refused'))
+    mocker.patch.object(async_readers, 'changed', return_value=True)
+
+    asyncio.run(async_readers.run(lambda: mockdatetime, count=2))
+
+    assert capsys.readouterr().out.count(
+        "upload failed: OSError('connection refused')") == 2
+    assert not async_readers.uploads
+
+
+def test_update_db_queues_on_uploader(mocker, mock_proc, mockdatetime):
+    post = mocker.patch('signal_processor.requests.post')
+    mock_proc.uploader = mocker.Mock()
+    mock_proc.current_state.update({'A1': 307, 'D2': 1, 'D3': 0})
+
+    assert mock_proc.update_db(mockdatetime) is None
+
+    post.assert_not_called()
+    mock_proc.uploader.put.assert_called_once_with(
+        '{"ts":"2021-01-01 00:00:00","src": "test",'
+        '"A1": 307,"D2": 1,"D3": 0}', {})
+    assert mock_proc.db_saved == mockdatetime.timestamp()
+
+
+def test_update_db_narrow(mocker, mock_proc, mockdatetime):
+    mock_proc.uploader = mocker.Mock()
+    mock_proc.storage_mode = 'narrow'
+    mock_proc.current_state.update({'A1': 307, 'D2': 1, 'D3': 0})
+    mock_proc.update_db(mockdatetime)
+    mock_proc.current_state['D2'] = 0
+    later = mockdatetime + datetime.timedelta(seconds=60)
+    mock_proc.update_db(later)
+
+    assert mock_proc.update_db(later) is None   # nothing changed: no record
+    assert [c.args for c in mock_proc.uploader.put.call_args_list] == [
+        ('{"ts":"2021-01-01 00:00:00","src": "test",'
+         '"values": {"A1": 307, "D2": 1, "D3": 0}}', {}),
+        ('{"ts":"2021-01-01 00:01:00","src": "test",'
+         '"values": {"D2": 0}}', {})]
+    assert mock_proc.db_saved == later.timestamp()
+
+
+def test_collect_inputs_captures_raw_reads(mock_readers, tmp_path):
+    path = str(tmp_path / 'capture.bin')
+    mock_readers.capture = capture.RawCapture(path, capacity=64)
+    mock_readers.sample_interval = 0
+    mock_readers.collect_inputs()
+    mock_readers.capture.close()
+
+    records = np.concatenate(capture.read_capture(path))
+    analogs = records[records['kind'] == capture.ANALOG]
+    assert len(analogs) == 10
+    assert round(analogs['value'].mean() * 1023) == 300
+    assert set(records[records['kind'] == capture.DIGITAL]['pin']) == {2, 3}
+
+
+def test_metrics_count_windows_and_changes(mock_readers, mockdatetime):
+    checks = signal_processor.CHANGE_CHECKS.value
+    changes = signal_processor.CHANGES.value
+    windows = signal_processor.WINDOW_SECONDS.count
+    mock_readers.sample_interval = 0
+    mock_readers.collect_inputs()
+    mock_readers.changed(mockdatetime.timestamp() + 1000)
+    mock_readers.db_saved = mockdatetime.timestamp() + 1000   # just saved
+    mock_readers.changed(mockdatetime.timestamp() + 1001)
+
+    assert signal_processor.WINDOW_SECONDS.count == windows + 1
+    assert signal_processor.READ_SECONDS.count >= 10
+    assert signal_processor.CHANGE_CHECKS.value == checks + 2
+    assert signal_processor.CHANGES.value == changes + 1
+
+
+@pytest.fixture
+def event_readers(mock_readers, mocker):
+    """ mock_readers in sampling_mode 'events': on_analog and on_digital
+    are the handlers listen_reports put in place of pyfirmata's, kept as
+    original_analog and original_digital """
+    board = mock_readers.board
+    mock_readers.original_analog = mocker.Mock(bytes_needed=3)
+    mock_readers.original_digital = mocker.Mock(bytes_needed=3)
+    board._command_handlers = {
+        signal_processor.ANALOG_MESSAGE: mock_readers.original_analog,
+        signal_processor.DIGITAL_MESSAGE: mock_readers.original_digital}
+    mock_readers.listen_reports()
+    handlers = board._command_handlers
+    mock_readers.on_analog = handlers[signal_processor.ANALOG_MESSAGE]
+    mock_readers.on_digital = handlers[signal_processor.DIGITAL_MESSAGE]
+    return mock_readers
+
+
+def test_listen_reports(event_readers):
+    event_readers.on_analog(1, 300 % 128, 300 >> 7)
+    # pyfirmata's handler still sets the pin value
+    event_readers.original_analog.assert_called_once_with(
+        1, 300 % 128, 300 >> 7)
+    assert event_readers.reports.get_nowait()[1:] == (
+        capture.ANALOG, 1, 300 / 1023)
+
+    event_readers.on_digital(0, 0b0001000, 0)   # D3 high, D2 low
+    event_readers.original_digital.assert_called_once_with(0, 0b0001000, 0)
+    reports = [event_readers.reports.get_nowait()[1:] for _ in range(2)]
+    assert sorted(reports) == [(capture.DIGITAL, 2, 0),
+                               (capture.DIGITAL, 3, 1)]
+    assert event_readers.reports.empty()
+
+
+def test_listen_reports_reads_as_many_bytes(event_readers):
+    # board.iterate() reads bytes_needed bytes, with the pin, per message
+    assert event_readers.on_analog.bytes_needed == 3
+    assert event_readers.on_digital.bytes_needed == 3
+
+
+def test_set_firmata_interval(mock_proc):
+    mock_proc.set_firmata_interval(1000)
+    mock_proc.board.send_sysex.assert_called_with(0x7A, [0x68, 7])
+
+
+def test_poll_mode_keeps_board_interval(mock_readers):
+    # mock_config has no sampling_mode: polled, reports stay off
+    assert mock_readers.reports is None
+    mock_readers.board.send_sysex.assert_not_called()
+    assert not isinstance(mock_readers.board._command_handlers, dict)
+
+
+def test_collect_reports(event_readers, mocker):
+    mocker.patch("signal_processor.ArduinoSignalProcessor.set_analog_num")
+    mocker.patch("signal_processor.ArduinoSignalProcessor.set_db_interval")
+    for i in range(15):
+        event_readers.on_analog(1, 300 % 128, 300 >> 7)
+        event_readers.on_analog(5, 0, 0)   # not sampled
+    event_readers.collect_inputs()
+
+    assert event_readers.reports.empty()   # the whole backlog is taken
+    assert event_readers.current_state == {'A1': 300, 'D2': 1, 'D3': 0}
+    assert not any(p.filter.bouncing for p in event_readers.dpins)
+
+
+def test_collect_reports_debounces_digital_reports(event_readers, mocker):
+    mocker.patch("signal_processor.ArduinoSignalProcessor.set_analog_num")
+    mocker.patch("signal_processor.ArduinoSignalProcessor.set_db_interval")
+    for i in range(15):
+        event_readers.on_analog(1, 300 % 128, 300 >> 7)
+    event_readers.collect_inputs()
+    d2 = event_readers.dpins[0]
+    assert d2.pin == 2 and event_readers.current_state['D2'] == 1
+
+    # D2 bounces low and back between ticks: every report reaches the
+    # Debouncer, which keeps the settled level
+    update = mocker.spy(d2, 'update')
+    event_readers.on_digital(0, 0, 0)
+    event_readers.on_digital(0, 0b100, 0)
+    for i in range(15):
+        event_readers.on_analog(1, 300 % 128, 300 >> 7)
+    event_readers.collect_inputs()
+
+    assert [c.args for c in update.call_args_list[:2]] == [(0,), (1,)]
+    assert event_readers.current_state['D2'] == 1
+
+
+def test_collect_reports_waits_for_reports(event_readers, mocker):
+    mocker.patch("signal_processor.ArduinoSignalProcessor.set_analog_num")
+    mocker.patch("signal_processor.ArduinoSignalProcessor.set_db_interval")
+    event_readers.sample_interval = 10   # would sleep 100 secs if polling
+
+    def board():
+        for i in range(10):
+            time.sleep(.005)
+            event_readers.on_analog(1, 500 % 128, 500 >> 7)
+    t0 = time.monotonic()
+    threading.Thread(target=board).start()
+    event_readers.collect_inputs()
+
+    assert event_readers.current_state['A1'] == 500
+    assert time.monotonic() - t0 < 1
+
+
+def test_collect_reports_times_out(event_readers):
+    event_readers.sample_interval = .001
+    event_readers.digital_time_budget = .05
+    t0 = time.monotonic()
+    event_readers.collect_inputs()
+    assert .05 <= time.monotonic() - t0 < 1
@@ -0,0 +1,119 @@
+# test_sim.py
+
+import time
+import json
+import asyncio
+import pytest
+import mock_config
+import capture
+import clock
+import sim
+import signal_processor
+import async_signal_processor
+
+
+def sim_proc(waves, processor_class=signal_processor.ArduinoSignalProcessor):
+    s = sim.Simulator(waves)
+    proc = processor_class()
+    proc.clock = s.clock
+    proc.initialize(mock_config, s.Arduino, s.util, s.clock.time())
+    return proc
+
+
+def test_virtual_clock():
+    c = clock.VirtualClock()
+    c.sleep(1.5)
+    assert c.monotonic() == 1.5 and c.monotonic_ns() == 1500000000
+    assert c.time() - c.epoch == 1.5
+    assert c.now().timestamp() == c.time()
+
+
+def test_sim_pins_follow_waves():
+    c = clock.VirtualClock()
+    board = sim.Simulator({'A1': sim.ramp(100, 10), 'D2': sim.square(2)},
+                          c).Arduino('sim')
+    assert board.analog[1].read() == round(100 / 1023, 4)
+    assert board.digital[2].read() == 1
+    c.sleep(1.5)
+    assert board.analog[1].read() == round(115 / 1023, 4)
+    assert board.digital[2].read() == 0
+    assert board.analog[0].read() == 0   # no wave
+
+
+def test_runs_faster_than_real_time():
+    proc = sim_proc({'A1': sim.with_noise(sim.ramp(300, .05), 1, seed=1),
+                     'D2': sim.constant(1), 'D3': sim.square(600)})
+    t0 = time.perf_counter()
+    records = sim.run(proc, 1000)
+    elapsed = time.perf_counter() - t0
+
+    # 1000 windows of initial_analog_num reads .1 secs apart
+    assert proc.clock.monotonic() > 500
+    assert proc.clock.monotonic() / elapsed > 1000
+    assert records and all('"src": "test"' in r for r in records)
+    assert proc.current_state['A1'] > 300
+
+
+def test_bouncing_digital_settles():
+    proc = sim_proc({'D2': sim.bouncing_square(60, 1, seed=1)})
+    sim.run(proc, 300)
+    while proc.clock.monotonic() % 30 < 10:   # well past the last edge
+        sim.run(proc, 1)
+    t = proc.clock.monotonic()
+
+    # D2 holds the level the wave settled to; bounces are only counted for
+    # reads within bounce_secs of an edge, reads .1 secs apart
+    assert proc.current_state['D2'] == int(t % 60 < 30)
+    edges = int(t // 30)
+    assert 0 < proc.bounce_counts()['D2'] <= 10 * edges
+
+
+def test_replays_capture(tmp_path):
+    path = str(tmp_path / 'capture.bin')
+    c = clock.VirtualClock()
+    cap = capture.RawCapture(path, 16, c)
+    for value in (.1, .2, .3):
+        cap.write(capture.ANALOG, 1, value)
+        c.sleep(1)
+    cap.close()
+
+    wave = sim.replay(path, capture.ANALOG, 1)
+    assert [round(wave(t)) for t in (0, .5, 1, 2, 9)] == [
+        102, 102, 205, 307, 307]
+    wave = sim.replay(path, capture.ANALOG, 1, loop=True)
+    assert round(wave(3.5)) == 102
+    with pytest.raises(ValueError):
+        sim.replay(path, capture.DIGITAL, 2)
+
+
+def test_async_processor_on_virtual_clock():
+    proc = sim_proc({'A1': sim.constant(300)},
+                    async_signal_processor.AsyncArduinoSignalProcessor)
+    asyncio.run(proc.collect_inputs())
+    assert proc.current_state['A1'] == 300
+    assert proc.clock.monotonic() > 1
+    asyncio.run(proc.aclose())
+
+
+def test_async_run_posts_the_state_of_each_window():
+    proc = sim_proc({'A1': sim.ramp(100, 1)},
+                    async_signal_processor.AsyncArduinoSignalProcessor)
+    proc.sample_interval = 0   # windows never yield to the posts
+    posts, windows = [], {}
+
+    class FakeClient:
+        async def post(self, url, content, headers):
+            posts.append(json.loads(content))
+
+    def now():   # a window every 40 secs, more than db_interval
+        proc.clock.sleep(40)
+        return proc.clock.now()
+
+    proc.client = FakeClient()
+    asyncio.run(proc.run(now, lambda r: windows.update({r['ts']: r['A1']}),
+                         5))
+
+    # each body holds the A1 of the window it was taken in
+    assert len(posts) == 5
+    assert [p['A1'] for p in posts] == [int(windows[p['ts']]) for p in posts]
+    assert [p['A1'] for p in posts] == [101, 141, 181, 221, 261]
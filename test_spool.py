@@ -0,0 +1,145 @@
+# test_spool.py
+
+import os
+import time
+import spool
+from uploader import Uploader
+from test_uploader import FakeSession, RefusingSession
+
+
+def test_append_read_ack(tmp_path):
+    s = spool.Spool(str(tmp_path))
+    assert [s.append(f'{{"A1": {i}}}') for i in range(3)] == [1, 2, 3]
+    s.append(b'\x01\x02')
+
+    records = s.read(10)
+    assert [(seq, body) for seq, _, body, _ in records] == [
+        (1, '{"A1": 0}'), (2, '{"A1": 1}'), (3, '{"A1": 2}'), (4, b'\x01\x02')]
+    assert records[3][3] == {'Content-Type': 'application/octet-stream'}
+    # read does not consume
+    assert [r[0] for r in s.read(2)] == [1, 2]
+    s.ack(2)
+    assert [r[0] for r in s.read(10)] == [3, 4]
+    assert s.pending() == 2
+
+
+def test_replays_unacked_after_restart(tmp_path):
+    s = spool.Spool(str(tmp_path))
+    for i in range(5):
+        s.append(f'{i}')
+    s.ack(2)
+    s.close()
+
+    s = spool.Spool(str(tmp_path))
+    assert [body for _, _, body, _ in s.read(10)] == ['2', '3', '4']
+    assert s.append('5') == 6
+
+
+def test_cuts_torn_tail(tmp_path):
+    s = spool.Spool(str(tmp_path))
+    s.append('kept')
+    s.append('torn')
+    s.close()
+    segment = os.path.join(str(tmp_path), os.listdir(str(tmp_path))[0])
+    with open(segment, 'r+b') as f:
+        f.truncate(os.path.getsize(segment) - 3)
+
+    s = spool.Spool(str(tmp_path))
+    assert [body for _, _, body, _ in s.read(10)] == ['kept']
+    assert s.append('next') == 2
+    assert [body for _, _, body, _ in s.read(10)] == ['kept', 'next']
+
+
+def test_rotates_and_deletes_acked_segments(tmp_path):
+    s = spool.Spool(str(tmp_path), segment_bytes=100)
+    for i in range(10):
+        s.append('x' * 40)
+    assert len(s.segments) == 5
+    assert [r[0] for r in s.read(3)] == [1, 2, 3]
+    s.ack(7)
+
+    assert len([f for f in os.listdir(str(tmp_path))
+                if f.endswith('.spool')]) == 2
+    assert [r[0] for r in s.read(10)] == [8, 9, 10]
+
+
+def test_uploader_keeps_records_while_server_is_down(tmp_path):
+    session = FakeSession(*[None] * 1000)
+    s = spool.Spool(str(tmp_path))
+    up = Uploader('http://db/pins', batch_size=2, max_age=0, retries=2,
+                  backoff=.01, session=session, spool=s)
+    up.start()
+    up.put('{"A1": 1}')
+    up.put('{"A1": 2}')
+    time.sleep(.2)
+    up.stop(1)
+
+    # only the oldest record is tried, again and again; both stay spooled
+    assert len(session.posts) >= 3
+    assert {data for _, data, _ in session.posts} == {'{"A1": 1}'}
+    assert up.stats()['queue_depth'] == 2 and up.stats()['failed'] == 0
+
+    session = FakeSession()
+    up = Uploader('http://db/pins', 'http://db/pins/batch', batch_size=10,
+                  max_age=60, session=session,
+                  spool=spool.Spool(str(tmp_path)))
+    up.start()
+    time.sleep(.1)
+    up.stop(1)
+
+    # replayed in one bulk post, oldest first, on the next run
+    assert session.posts == [('http://db/pins/batch',
+                              '[{"A1": 1},{"A1": 2}]', {})]
+    assert up.stats()['queue_depth'] == 0
+
+
+def test_uploader_replay_rate(tmp_path):
+    s = spool.Spool(str(tmp_path))
+    for i in range(6):
+        s.append(f'{i}')
+    session = FakeSession()
+    up = Uploader('http://db/pins', 'http://db/pins/batch', batch_size=2,
+                  session=session, spool=s, rate=40)
+    t0 = time.monotonic()
+    up.start()
+    while up.stats()['queue_depth'] and time.monotonic() - t0 < 2:
+        time.sleep(.01)
+
+    # 6 records at 40/s: the last batch starts after 2 pauses of 50ms
+    assert time.monotonic() - t0 >= .1
+    assert len(session.posts) == 3
+    up.stop(1)
+
+
+def run_spooled(tmp_path, session, bodies):
+    """ RETURNS: the uploader once it tried to forward bodies in a batch """
+    s = spool.Spool(str(tmp_path))
+    for body in bodies:
+        s.append(body)
+    up = Uploader('http://db/pins', 'http://db/pins/batch',
+                  batch_size=len(bodies), retries=0, backoff=.05,
+                  session=session, spool=s)
+    up.start()
+    time.sleep(.1)
+    up.stop(1)
+    return up
+
+
+def test_uploader_drops_only_invalid_records_of_a_rejected_batch(tmp_path):
+    up = run_spooled(tmp_path, RefusingSession(422),
+                     ['{"A1": 1}', '{"bad": 1}', '{"A1": 3}'])
+
+    assert up.stats()['sent'] == 2 and up.stats()['failed'] == 1
+    assert up.stats()['queue_depth'] == 0
+
+
+def test_uploader_keeps_records_the_server_refuses(tmp_path):
+    # eg 401 on an expired token: the records are fine, keep them
+    up = run_spooled(tmp_path, RefusingSession(401, *[401] * 100),
+                     ['{"A1": 1}', '{"A1": 2}'])
+
+    assert up.stats()['sent'] == 0 and up.stats()['failed'] == 0
+    assert up.stats()['queue_depth'] == 2
+    s = spool.Spool(str(tmp_path))
+    bodies = [body for _, _, body, _ in s.read(10)]
+    assert bodies == ['{"A1": 1}', '{"A1": 2}']
@@ -0,0 +1,95 @@
+# test_supervisor.py
+
+import time
+import pytest
+import mock_config
+import supervisor
+import signal_processor
+
+
+class FakeProcessor(signal_processor.ArduinoSignalProcessor):
+    """ a window costs window_secs; board 'slow' takes a whole second """
+
+    def initialize(self, config, Arduino, util, timestamp):
+        self.config = config
+        self.src = config.src
+        self.current_state = {'A1': 0}
+        self.compressor = None
+        self.capture = None
+        self.board = Arduino(config.usb_port)
+        if config.src == 'broken':
+            raise OSError('could not open port')
+
+    def collect_inputs(self):
+        time.sleep(1 if self.src == 'slow' else .01)
+        self.current_state['A1'] += 1
+
+    def changed(self, ts):
+        return True
+
+    def update_db(self, datetimestamp, state=None):
+        self.uploader.put(f'{{"src": "{self.src}"}}')
+
+
+@pytest.fixture
+def boards(mocker):
+    uploader = mocker.Mock()
+    sup = supervisor.BoardSupervisor(
+        mock_config,
+        [{'src': 'fast', 'usb_port': '/dev/a'},
+         {'src': 'slow', 'usb_port': '/dev/b', 'input_names': ['A1']},
+         {'src': 'broken', 'usb_port': '/dev/c'}],
+        mocker.Mock(), mocker.Mock(), uploader, FakeProcessor, retry_secs=.05)
+    yield sup
+    sup.stop(2)
+
+
+def test_board_config_overrides():
+    c = supervisor.board_config(mock_config,
+                                {'src': 'b2', 'input_names': ['A0']})
+    assert c.src == 'b2' and c.input_names == ['A0']
+    assert c.usb_port == mock_config.usb_port and c.digital_num == 5
+
+
+def test_boards_need_their_own_src(mocker):
+    with pytest.raises(ValueError):
+        supervisor.BoardSupervisor(mock_config, [{'src': 'a'}, {'src': 'a'}],
+                                   None, None, mocker.Mock())
+
+
+def test_slow_and_broken_boards_do_not_stall_the_others(boards):
+    boards.start()
+    time.sleep(.3)
+    status = boards.status()['boards']
+
+    assert status['fast']['windows'] > 10
+    assert status['slow']['windows'] == 0
+    assert status['broken']['errors'] >= 2
+    assert 'could not open port' in status['broken']['last_error']
+    data = boards.get_data()
+    assert data['fast']['src'] == 'fast' and data['fast']['A1'] > 10
+    assert data['slow'] is None and data['broken'] is None
+    # every board uses the one shared uploader
+    boards.uploader.put.assert_any_call('{"src": "fast"}')
+
+
+def test_stop_closes_boards_and_flushes_uploader(boards):
+    boards.start()
+    time.sleep(.1)
+    boards.stop(2)
+
+    assert not any(b.thread.is_alive() for b in boards.boards)
+    boards.boards[0].proc.board.exit.assert_called()
+    boards.uploader.stop.assert_called_once()
+
+
+def test_failed_initialize_closes_the_opened_board(boards, mocker):
+    broken = boards.boards[2]
+    broken.Arduino = mocker.Mock()
+    boards.start()
+    time.sleep(.2)
+    boards.stop(2)
+
+    # each attempt opened the port and raised; every board was exited
+    assert broken.errors >= 2 and broken.opened is None
+    assert broken.Arduino.return_value.exit.call_count == broken.errors
@@ -0,0 +1,114 @@
+# test_uploader.py
+
+import time
+import pytest
+import requests
+from uploader import Uploader
+
+
+class FakeResponse:
+    def __init__(self, status_code):
+        self.status_code = status_code
+        self.ok = status_code < 400
+        self.text = ''
+
+
+class FakeSession:
+    """ records posts, answers with the given status codes in turn """
+
+    def __init__(self, *codes):
+        self.codes = list(codes)
+        self.posts = []
+
+    def post(self, url, data=None, headers=None):
+        self.posts.append((url, data, headers))
+        code = self.codes.pop(0) if self.codes else 200
+        if code is None:
+            raise requests.exceptions.ConnectionError('refused')
+        return FakeResponse(code)
+
+
+class RefusingSession(FakeSession):
+    """ answers code to the batch url and to records holding "bad" """
+
+    def __init__(self, code, *codes):
+        super().__init__(*codes)
+        self.code = code
+
+    def post(self, url, data=None, headers=None):
+        if url.endswith('/batch') or 'bad' in data:
+            self.posts.append((url, data, headers))
+            return FakeResponse(self.code)
+        return super().post(url, data, headers)
+
+
+def test_flushes_by_size_as_one_batch_post():
+    session = FakeSession()
+    up = Uploader('http://db/pins', 'http://db/pins/batch', batch_size=3,
+                  max_age=60, session=session)
+    up.start()
+    for i in range(3):
+        up.put(f'{{"A1": {i}}}')
+    time.sleep(.1)
+
+    assert session.posts == [('http://db/pins/batch',
+                              '[{"A1": 0},{"A1": 1},{"A1": 2}]', {})]
+    up.stop(1)
+    assert up.stats()['sent'] == 3 and up.stats()['queue_depth'] == 0
+
+
+def test_flushes_by_age_per_record_without_batch_url():
+    session = FakeSession()
+    up = Uploader('http://db/pins', batch_size=100, max_age=.05,
+                  session=session)
+    up.start()
+    up.put(b'\x01', {'Content-Type': 'application/octet-stream'})
+    up.put(b'\x02', {'Content-Type': 'application/octet-stream'})
+    time.sleep(.2)
+
+    assert [data for _, data, _ in session.posts] == [b'\x01', b'\x02']
+    assert up.stats()['batches'] == 1
+    up.stop(1)
+
+
+def test_stop_flushes_queue():
+    session = FakeSession()
+    up = Uploader('http://db/pins', batch_size=100, max_age=60,
+                  session=session)
+    up.start()
+    up.put('{}')
+    up.stop(1)
+
+    assert len(session.posts) == 1 and not up.thread.is_alive()
+
+
+@pytest.mark.parametrize('codes, sent, posts', [
+    ((None, 503, 200), 1, 3),   # connection error and 5xx are retried
+    ((422,), 0, 1),             # the same body would fail again
+    ((500, 500, 500), 0, 3),    # gives up after retries
+])
+def test_retry_and_backoff(mocker, codes, sent, posts):
+    sleep = mocker.patch('uploader.time.sleep')
+    session = FakeSession(*codes)
+    up = Uploader('http://db/pins', retries=2, backoff=.5, session=session)
+
+    up.flush([('{}', {})])
+    assert up.stats()['sent'] == sent
+    assert len(session.posts) == posts
+    assert [c.args[0] for c in sleep.call_args_list] == [.5, 1.0][:posts - 1]
+    assert up.stats()['failed'] == 1 - sent
+
+
+def test_rejected_batch_is_posted_record_by_record():
+    session = RefusingSession(422)
+    up = Uploader('http://db/pins', 'http://db/pins/batch', session=session)
+
+    assert up.flush([('{"A1": 1}', {}), ('{"bad": 1}', {}),
+                     ('{"A1": 3}', {})]) == 3
+
+    assert [(url, data) for url, data, _ in session.posts] == [
+        ('http://db/pins/batch', '[{"A1": 1},{"bad": 1},{"A1": 3}]'),
+        ('http://db/pins', '{"A1": 1}'), ('http://db/pins', '{"bad": 1}'),
+        ('http://db/pins', '{"A1": 3}')]
+    # only the invalid record is dropped
+    assert up.stats()['sent'] == 2 and up.stats()['failed'] == 1
@@ -0,0 +1,240 @@
+# file: uploader.py
+
+import time
+import queue
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+import metrics
+
+POST_SECONDS = metrics.registry.histogram(
+    'sampler_post_seconds', 'Latency of one post to the db.')
+FLUSH_SECONDS = metrics.registry.histogram(
+    'uploader_flush_seconds',
+    'Duration of posting one batch, retries included.')
+
+# client errors that reject the record itself: posting it again cannot help
+INVALID = (400, 422)
+
+
+class Uploader:
+    """
+    Takes encoded records off the sampling thread and posts them to the db
+    from its own thread, so upload latency never adds to sampling latency.
+    Records are queued and flushed as a batch when batch_size records are
+    waiting or the oldest has waited max_age secs. Posts go through one
+    requests.Session, whose pool keeps up to pool_size keep-alive
+    connections, so a record does not pay for a new TCP connection.
+    With a batch_url the whole batch is one post; without one, or when the
+    server rejects the batch, each record of the batch is posted to url
+    over the same connection.
+    Failed posts are retried with exponential backoff, retries times.
+    With a spool.Spool, records are written to it instead of the in-memory
+    queue and only acknowledged there once the server has them, so nothing
+    is lost while the server is down; a backlog, also one left by an
+    earlier run, is forwarded oldest first at no more than rate records
+    per sec.
+    """
+
+    def __init__(self, url, batch_url=None, batch_size=50, max_age=5.0,
+                 retries=5, backoff=.5, pool_size=4, session=None,
+                 spool=None, rate=None):
+        self.url = url
+        self.batch_url = batch_url
+        self.batch_size = batch_size
+        self.max_age = max_age
+        self.retries = retries
+        self.backoff = backoff
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+        self.session = session
+        self.spool = spool
+        self.rate = rate
+        self.queue = queue.Queue()
+        self.wake = threading.Event()
+        self.stopping = threading.Event()
+        self.thread = None
+        self.sent = self.failed = self.retried = self.batches = 0
+        self.last_flush_secs = self.max_flush_secs = 0.0
+
+    def start(self):
+        run = self.run if self.spool is None else self.run_spool
+        self.thread = threading.Thread(target=run, name='uploader',
+                                       daemon=True)
+        self.thread.start()
+
+    def stop(self, timeout=None):
+        """
+        flushes what is queued, then ends the upload thread. A spool keeps
+        what could not be sent for the next run.
+        """
+        self.stopping.set()
+        self.queue.put(None)
+        self.wake.set()
+        if self.thread is not None:
+            self.thread.join(timeout)
+        if self.spool is not None:
+            self.spool.close()
+
+    def put(self, body, headers=None):
+        """
+        queues one encoded record (see ArduinoSignalProcessor.encode).
+        Never blocks on the network; with a spool, it is written there first.
+        """
+        if self.spool is not None:
+            self.spool.append(body, headers)
+            self.wake.set()
+        else:
+            self.queue.put((time.monotonic(), body, headers or {}))
+
+    def run(self):
+        batch = []
+        stopping = False
+        while not stopping:
+            timeout = None
+            if batch:
+                timeout = max(0, batch[0][0] + self.max_age - time.monotonic())
+            try:
+                item = self.queue.get(timeout=timeout)
+                if item is None:
+                    stopping = True
+                else:
+                    batch.append(item)
+            except queue.Empty:
+                pass
+            if batch and (stopping or len(batch) >= self.batch_size or
+                          time.monotonic() - batch[0][0] >= self.max_age):
+                self.flush([(body, headers) for _, body, headers in batch])
+                batch = []
+
+    def run_spool(self):
+        """
+        forwards spooled records oldest first and acknowledges them. Only
+        records the server took, or rejected as INVALID, are acknowledged;
+        what cannot be delivered, or is refused otherwise, eg 401 on an
+        expired token, stays in the spool and is tried again after a pause
+        of backoff * 2 ** retries secs.
+        """
+        while True:
+            self.wake.clear()
+            stopping = self.stopping.is_set()
+            batch = self.spool.read(self.batch_size)
+            if batch and (stopping or len(batch) >= self.batch_size or
+                          time.time() - batch[0][1] >= self.max_age):
+                t0 = time.monotonic()
+                done = self.flush([(body, headers)
+                                   for _, _, body, headers in batch], True)
+                if done:
+                    self.spool.ack(batch[done - 1][0])
+                if done < len(batch):
+                    if stopping:
+                        break
+                    self.stopping.wait(self.backoff * 2 ** self.retries)
+                elif self.rate:
+                    pause = done / self.rate - (time.monotonic() - t0)
+                    if pause > 0:
+                        self.stopping.wait(pause)
+                continue
+            if stopping:
+                break
+            timeout = self.spool.fsync_secs
+            if batch:
+                deadline = batch[0][1] + self.max_age
+                timeout = min(timeout, deadline - time.time())
+            self.wake.wait(max(0, timeout))
+            self.spool.sync(due_only=True)
+
+    def flush(self, records, in_order=False):
+        """
+        posts a batch of (body, headers) records.
+        RETURNS: how many records, from the first, the server took or
+        rejected for good. A batch post the server rejects is posted again
+        record by record to url, so only the records it rejects on their
+        own are dropped, not the whole batch. With in_order, posting stops
+        at the first record that could not be delivered or was refused for
+        another reason than being INVALID, eg 401 or 413, so none is posted
+        out of order or dropped while it may still be taken; those records
+        are then not counted as failed.
+        """
+        t0 = time.monotonic()
+        responses = None
+        if self.batch_url is not None:
+            response = self.post(self.batch_url, *self.join(records))
+            if response is None or response.ok:
+                responses = [response] * len(records)
+        if responses is None:
+            responses = []
+            for body, headers in records:
+                response = self.post(self.url, body, headers)
+                if in_order and not settled(response):
+                    break
+                responses.append(response)
+        if in_order and responses and responses[0] is None:
+            responses = []
+        sent = sum(r is not None and r.ok for r in responses)
+        self.sent += sent
+        self.failed += len(responses) - sent
+        self.batches += 1
+        self.last_flush_secs = time.monotonic() - t0
+        FLUSH_SECONDS.observe(self.last_flush_secs)
+        self.max_flush_secs = max(self.max_flush_secs, self.last_flush_secs)
+        return len(responses)
+
+    def join(self, records):
+        """
+        RETURNS: (body, headers) of one post holding every record:
+        a json array, or the concatenated binary records.
+        """
+        headers = records[0][1]
+        bodies = [body for body, _ in records]
+        if isinstance(bodies[0], bytes):
+            return b''.join(bodies), headers
+        return '[' + ','.join(bodies) + ']', headers
+
+    def post(self, url, body, headers):
+        """
+        RETURNS: the response once ok or rejected for good, None when it
+        could not be delivered. Server errors (5xx, 429) and connection
+        errors are retried, other client errors are not, since the same
+        body would fail again.
+        """
+        for attempt in range(self.retries + 1):
+            if attempt:
+                self.retried += 1
+                time.sleep(self.backoff * 2 ** (attempt - 1))
+            try:
+                with POST_SECONDS.time():
+                    response = self.session.post(url, data=body,
+                                                 headers=headers)
+            except requests.exceptions.RequestException as e:
+                print(f'upload failed: {e}')
+                continue
+            if response.ok:
+                return response
+            print(f'upload failed: {response.status_code} {response.text}')
+            if response.status_code < 500 and response.status_code != 429:
+                return response
+        return None
+
+    def stats(self):
+        """
+        RETURNS: dict of queue depth, record and batch counts and the last
+        and largest flush latency in secs.
+        """
+        depth = self.queue.qsize()
+        if self.spool is not None:
+            depth = self.spool.pending()
+        return {'queue_depth': depth, 'sent': self.sent,
+                'failed': self.failed, 'retried': self.retried,
+                'batches': self.batches,
+                'last_flush_secs': self.last_flush_secs,
+                'max_flush_secs': self.max_flush_secs}
+
+
+def settled(response):
+    """ RETURNS: True when the server took the record or found it INVALID """
+    return response is not None and (response.ok or
+                                     response.status_code in INVALID)